@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+import numpy
+
+
+def load_narrative():
+    """Imports enemy-narr.py (the hyphen keeps it from being imported by name)
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "enemy-narr.py")
+    spec = importlib.util.spec_from_file_location("enemy_narr", path)
+    module = importlib.util.module_from_spec(spec)
+    # registered so worker processes can unpickle the module's functions
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+narr = load_narrative()
+
+
+def percentiles(samples_ns):
+    """Summarizes latency samples
+        Args:
+            samples_ns(list): latencies in nanoseconds
+        Return:
+            summary(dict): count, mean, p50, p99 and max in microseconds
+    """
+    samples = numpy.asarray(samples_ns, dtype=float) / 1000.0
+    return {"count": len(samples),
+            "mean_us": float(samples.mean()),
+            "p50_us": float(numpy.percentile(samples, 50)),
+            "p99_us": float(numpy.percentile(samples, 99)),
+            "max_us": float(samples.max())}
+
+
+CONFLICTS = [{"name": "conflict_%d" % conflict,
+               "combatant_1": "combatant_%d" % (2 * conflict),
+               "combatant_2": "combatant_%d" % (2 * conflict + 1)} for conflict in range(3)]
+COMBATANTS = [name for conflict in CONFLICTS for name in (conflict["combatant_1"], conflict["combatant_2"])]
+
+
+def timed(function, calls):
+    """Times function(*args) for each args tuple
+        Return:
+            summary(dict): see percentiles
+    """
+    samples = []
+    clock = time.perf_counter_ns
+    for args in calls:
+        start = clock()
+        function(*args)
+        samples.append(clock() - start)
+    return percentiles(samples)
+
+
+def synthetic_cohort(users, seed=0):
+    """Random per-user aggregates shaped roughly like the visitor archive
+        Return:
+            cohort(Cohort_Store)
+    """
+    rng = numpy.random.default_rng(seed)
+    return narr.Cohort_Store.from_arrays(range(users),
+                                         rng.normal(1.5, 0.4, users).clip(0.3),
+                                         rng.gamma(2.0, 0.05, users),
+                                         rng.gamma(2.0, 0.15, users))
+
+
+def synthetic_model(users, seed=0):
+    """Builds a model over a random cohort, with looking-at-face counts and web
+       registration answers for every user against the COMBATANTS of CONFLICTS
+        Args:
+            users(int): number of users in the cohort
+            seed(int): random seed
+        Return:
+            model(Bias_Nervousness_Model)
+    """
+    rng = numpy.random.default_rng(seed + 1)
+    model = narr.Bias_Nervousness_Model(synthetic_cohort(users, seed))
+    model.gaze.add_scene("scene", {name: ((column, 1.7, 2.0), 0.15) for column, name in enumerate(COMBATANTS)})
+    model.gaze.users = {user_id: user_id for user_id in range(users)}
+    model.gaze.seen = numpy.full((users, len(COMBATANTS)), 900.0)
+    model.gaze.looked = rng.binomial(900, rng.beta(6, 3, (users, len(COMBATANTS)))).astype(float)
+    table = narr.Web_Registration_Table()
+    table.users = dict(model.gaze.users)
+    table.combatants = {name: column for column, name in enumerate(COMBATANTS)}
+    table.completed = rng.random(users) < 0.7
+    table.answers = rng.integers(0, 6, (users, table.QUESTIONS)).astype(numpy.int8)
+    table.bias_flags = rng.random((users, len(COMBATANTS))) < 0.2
+    model.web_registration = table
+    return model
+
+
+def synthetic_frames(frames, fps=90, seed=0):
+    """Fake headset stream: a head drifting around a standing spot, glancing between
+       the combatants of the synthetic scene
+        Return:
+            frames(generator): (timestamp, position, rotation, gaze_target) tuples
+    """
+    rng = numpy.random.default_rng(seed)
+    positions = numpy.cumsum(rng.normal(0, 0.002, (frames, 3)), axis=0) + (0.0, 1.6, 0.0)
+    angles = numpy.cumsum(rng.normal(0, 0.01, frames))
+    targets = rng.integers(0, len(COMBATANTS), frames)
+    for frame in range(frames):
+        half = angles[frame] / 2.0
+        yield (frame / float(fps), positions[frame].tolist(),
+               (math.cos(half), 0.0, math.sin(half), 0.0),
+               (float(targets[frame]), 1.7, 2.0))
+
+
+def bench_sky(headsets=48, seconds=450.0, fps=90, step_seconds=30.0, users=1000, seed=0):
+    """Ticks the sky of several concurrent headsets at frame rate in simulated time
+        Args:
+            headsets(int): number of concurrent headsets
+            seconds(float): simulated encounter length
+            fps(int): renderer poll rate per headset
+            step_seconds(float): seconds between opacity steps
+            users(int): size of the cohort behind the bounds
+        Return:
+            result(dict): per-tick latency summary
+    """
+    model = synthetic_model(users, seed)
+    model.sky.step_seconds = step_seconds
+    samples = []
+    clock = time.perf_counter_ns
+    tick = model.sky.tick
+    # each headset faces one of the synthetic combatants, so the gaze lookups hit
+    facing = [COMBATANTS[user_id % len(COMBATANTS)] for user_id in range(headsets)]
+    for frame in range(int(seconds * fps)):
+        now = frame / float(fps)
+        for user_id in range(headsets):
+            start = clock()
+            tick(user_id, facing[user_id], now)
+            samples.append(clock() - start)
+    result = percentiles(samples)
+    result.update({"name": "sky_tick", "headsets": headsets, "fps": fps,
+                   "simulated_seconds": seconds, "step_seconds": step_seconds})
+    return result
+
+
+async def run_station(port, station, requests, users_per_station, samples):
+    """One simulated headset station: a single connection sending sky ticks, scores and
+       an end of session every users_per_station-th request
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    clock = time.perf_counter_ns
+    for request_id in range(requests):
+        user_id = station * users_per_station + request_id % users_per_station
+        kind = request_id % 10
+        combatant_name = COMBATANTS[request_id % len(COMBATANTS)]
+        if kind == 9:
+            request = {"id": request_id, "op": "end_session", "user_id": user_id,
+                       "values": [1.5, 0.1, 0.3]}
+        elif kind == 8:
+            request = {"id": request_id, "op": "score", "user_id": user_id, "combatant": combatant_name}
+        else:
+            request = {"id": request_id, "op": "sky", "user_id": user_id, "combatant": combatant_name}
+        start = clock()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        samples.append(clock() - start)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+    writer.close()
+
+
+async def load_test(stations=16, requests=2000, users=10000, seed=0):
+    """Runs a Scoring_Service on localhost and hammers it from N stations
+        Args:
+            stations(int): number of concurrent station connections
+            requests(int): requests sent by each station
+            users(int): size of the cohort behind the bounds
+        Return:
+            result(dict): request latency summary and overall throughput
+    """
+    service = narr.Scoring_Service(synthetic_model(users, seed))
+    server = await service.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    samples = []
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*[run_station(port, station, requests, users // stations, samples)
+                               for station in range(stations)])
+    elapsed = time.perf_counter() - start
+    result = percentiles(samples)
+    result.update({"name": "service_load", "stations": stations,
+                   "requests_per_second": len(samples) / elapsed})
+    return result
+
+
+def bench_suite(users, seed=0, samples=2000):
+    """Times every public scoring entry point of the model against a cohort
+        Args:
+            users(int): cohort size
+            seed(int): random seed
+            samples(int): calls timed per per-call benchmark
+        Return:
+            results(list): one summary dict per benchmark
+    """
+    results = []
+
+    def add(name, summary, **extra):
+        summary.update(name=name, users=users, **extra)
+        results.append(summary)
+
+    cohort = synthetic_cohort(users, seed)
+    add("construct", timed(narr.Bias_Nervousness_Model, [(cohort,)] * 5))
+    model = synthetic_model(users, seed)
+    add("calculate_bounds", timed(model.calculate_bounds, [()] * 20))
+    add("end_session", timed(model.end_session, [(users + i, 1.5, 0.1, 0.3) for i in range(samples)]))
+
+    rng = numpy.random.default_rng(seed)
+    user_ids = rng.integers(0, users, samples).tolist()
+    combatants = [COMBATANTS[i] for i in rng.integers(0, len(COMBATANTS), samples)]
+    pairs = list(zip(combatants, user_ids))
+    model.scores.clear()
+    add("nervous_toward_combatant_score", timed(model.nervous_toward_combatant_score, pairs))
+    add("nervous_toward_combatant_score_cached", timed(model.nervous_toward_combatant_score, pairs))
+    model.scores.clear()
+    add("nervous_toward_combatant_score_web_reg", timed(model.nervous_toward_combatant_score_web_reg, pairs))
+    batch = list(range(min(users, 10000)))
+    add("score_matrix", timed(model.score_matrix, [(batch, COMBATANTS)] * 5), batch=len(batch))
+    add("score_matrix_web_reg", timed(lambda: model.score_matrix(batch, COMBATANTS, web_reg=True), [()] * 5),
+        batch=len(batch))
+
+    model.scores.clear()
+    decisions = [(CONFLICTS[i % 3], user_id) for i, user_id in enumerate(user_ids)]
+    add("biased_toward_which", timed(model.biased_toward_which, decisions))
+    add("biased_toward_which_web_reg", timed(model.biased_toward_which_web_reg, decisions))
+    model.scores.clear()
+    add("post_epilogue_transformation_mirror", timed(model.post_epilogue_transformation_mirror, decisions))
+    add("epilogue_intro", timed(model.epilogue_intro, [(user_id,) for user_id in user_ids]))
+    add("epilogue_cases", timed(model.epilogue_cases, [(batch,)] * 5), batch=len(batch))
+
+    # a fixed set of headsets, each ticked once untimed so that every timed tick is a
+    # step (or an idle tick) of a running sky rather than the first tick of a session
+    headsets = user_ids[:48]
+    for user_id in headsets:
+        model.sky.tick(user_id, COMBATANTS[0], 0.0)
+    ticks = [(headsets[i % len(headsets)], COMBATANTS[0], 1.0 + i) for i in range(samples)]
+    model.sky.step_seconds = 0.0
+    add("sky_tick_stepping", timed(model.sky.tick, ticks), headsets=len(headsets))
+    model.sky.step_seconds = 1e9
+    add("sky_tick_idle", timed(model.sky.tick, ticks), headsets=len(headsets))
+
+    stream = narr.Sensor_Stream(model)
+    frames = list(synthetic_frames(samples * 10, seed=seed))
+    start = time.perf_counter()
+    stream.ingest(users + samples, frames, scene="scene")
+    add("sensor_stream_ingest", {"frames": len(frames),
+                                 "frames_per_second": len(frames) / (time.perf_counter() - start)})
+    return results
+
+
+def compare(baseline_path, current_path, tolerance=0.1):
+    """Compares the p50 latencies and the throughputs (*_per_second) of two suite runs
+        Args:
+            baseline_path(str): JSON output of an earlier run
+            current_path(str): JSON output of the run to check
+            tolerance(float): relative slowdown reported as a regression
+        Return:
+            report(dict): per-benchmark slowdown ratios (above 1 is slower, for
+                          latencies and throughputs alike) and the list of regressions
+    """
+    with open(baseline_path) as handle:
+        baseline = {(result["name"], result["users"]): result for result in json.load(handle)["results"]}
+    with open(current_path) as handle:
+        current = json.load(handle)["results"]
+    ratios = []
+    for result in current:
+        before = baseline.get((result["name"], result["users"]))
+        if before is None:
+            continue
+        for metric in result:
+            if metric not in before or not (metric == "p50_us" or metric.endswith("_per_second")):
+                continue
+            # latencies grow and throughputs shrink when the code gets slower
+            slower, faster = ((result[metric], before[metric]) if metric == "p50_us" else
+                              (before[metric], result[metric]))
+            ratios.append({"name": result["name"], "users": result["users"], "metric": metric,
+                           "ratio": slower / faster if faster else float("inf")})
+    return {"ratios": ratios,
+            "regressions": [ratio for ratio in ratios if ratio["ratio"] > 1 + tolerance]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the Enemy narrative model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sky = subparsers.add_parser("sky", help="per-tick latency of the sky driver")
+    sky.add_argument("--headsets", type=int, default=48)
+    sky.add_argument("--seconds", type=float, default=450.0)
+    sky.add_argument("--fps", type=int, default=90)
+    sky.add_argument("--step-seconds", type=float, default=30.0)
+    load = subparsers.add_parser("loadtest", help="N stations against a local Scoring_Service")
+    load.add_argument("--stations", type=int, default=16)
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--users", type=int, default=10000)
+    suite = subparsers.add_parser("suite", help="time every scoring method on synthetic cohorts")
+    suite.add_argument("--sizes", default="1000,100000,1000000",
+                       help="comma separated cohort sizes")
+    suite.add_argument("--samples", type=int, default=2000)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--output", help="write the JSON results here instead of stdout")
+    diff = subparsers.add_parser("compare", help="compare two suite outputs")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+    diff.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        sizes = [int(size) for size in args.sizes.split(",")]
+        result = {"meta": {"python": platform.python_version(), "numpy": numpy.__version__,
+                           "machine": platform.machine(), "time": time.time(), "sizes": sizes},
+                  "results": [summary for size in sizes
+                              for summary in bench_suite(size, args.seed, args.samples)]}
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(result, handle, indent=2)
+            return
+    elif args.command == "compare":
+        result = compare(args.baseline, args.current, args.tolerance)
+    elif args.command == "sky":
+        result = bench_sky(args.headsets, args.seconds, args.fps, args.step_seconds)
+    elif args.command == "loadtest":
+        result = asyncio.run(load_test(args.stations, args.requests, args.users))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
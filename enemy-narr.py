@@ -1,3 +1,15 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import numpy
 
 
@@ -5,47 +17,1304 @@ import numpy
 # lower: 4.097
 # upper: 4.629
 
-class Bias_Nervousness_Model():
+# tunable thresholds of the model; override per model with Bias_Nervousness_Model(..., thresholds={...})
+THRESHOLDS = {"looking_at_face": 0.66,      # share of time on a combatant's face below which the user is looking away
+              "far_distance": 1.5,          # x DISTANCE_MEAN_STD: standing very far away from the combatant
+              "away_stillness": 2.0,        # x STILLNESS_MEAN_STD added to stillness when looking away
+              "far_stillness": 1.0,         # x STILLNESS_MEAN_STD added to stillness when standing far away
+              "far_distance_offset": 2.0,   # x DISTANCE_MEAN_STD added to distance when standing far away
+              "web_reg_below": 1.0,         # x MEAN_STD added when looking away below the lower bound (web_reg)
+              "web_reg_above": 2.0,         # x MEAN_STD added when looking away above the lower bound (web_reg)
+              "web_reg_biased": 1.0,        # extra x MEAN_STD when the web registration reports a bias
+              "lower_bound": None,          # fixed overall bounds (e.g. 4.097 / 4.629); None uses the cohort's
+              "upper_bound": None}
+
+# the thresholds each variant of the scoring reads; the others cannot change its scores
+VARIANT_THRESHOLDS = {"plain": {"looking_at_face", "far_distance", "away_stillness", "far_stillness",
+                                "far_distance_offset"},
+                      "web_reg": {"looking_at_face", "web_reg_below", "web_reg_above", "web_reg_biased",
+                                  "lower_bound", "upper_bound"}}
+
+def bounds_from_moments(means, stds):
+    """Builds the attentiveness bounds from the per-column moments of the cohort
+        Args:
+            means(array-like): mean of mean distance, stillness and angular stillness
+            stds(array-like): standard deviation of the same three columns
+        Return:
+            bounds(dict): {"upper_bound": X, "lower_bound": Y, "overall_mean_std": Z,
+                           "stillness": {...}, "distance": {...}}
+    """
+    mean_mean_distance, mean_stillness, mean_angular_stillness = [float(x) for x in means]
+    std_mean_distance, std_stillness, std_angular_stillness = [float(x) for x in stds]
+
+    #overall stillness
+    overall_stillness_mean = mean_stillness + mean_angular_stillness
+    overall_stillness_mean_std = (std_stillness ** 2 + std_angular_stillness ** 2) ** 0.5
+
+    # overall attentiveness (stillness, angular stillness and distance summed)
+    overall_mean = overall_stillness_mean + mean_mean_distance
+    overall_mean_std = (overall_stillness_mean_std ** 2 + std_mean_distance ** 2) ** 0.5
+
+    return {"upper_bound": overall_mean + overall_mean_std,
+            "lower_bound": overall_mean - overall_mean_std,
+            "overall_mean_std": overall_mean_std,
+            "stillness": {"overall_stillness_mean_std": overall_stillness_mean_std,
+            "overall_stillness_upper_bound": overall_stillness_mean + overall_stillness_mean_std,
+            "overall_stillness_lower_bound": overall_stillness_mean - overall_stillness_mean_std},
+            "distance": {"distance_mean_std": std_mean_distance,
+            "distance_upper_bound": mean_mean_distance + std_mean_distance,
+            "distance_lower_bound": mean_mean_distance - std_mean_distance}}
+
+
+def column_moments(values):
+    """Mean and population variance of each column of an (n, 3) block of rows
+        Args:
+            values(numpy.ndarray): rows of mean distance, stillness and angular stillness
+        Return:
+            (means, variances): numpy arrays of 3
+    """
+    # the session table interleaves the columns with other fields; reducing along
+    # contiguous columns is several times faster than along the strided rows
+    columns = numpy.ascontiguousarray(values.T)
+    return columns.mean(axis=1), columns.var(axis=1)
+
+
+def lookup_pairs(matrix, rows, columns, default):
+    """Gathers matrix at every (row, column) pair; negative row or column numbers
+       (ids that are not in the table) give the default
+        Args:
+            matrix(numpy.ndarray): 2-d table
+            rows(numpy.ndarray): row numbers, -1 for unknown
+            columns(numpy.ndarray): column numbers, -1 for unknown
+            default: value for unknown pairs
+        Return:
+            values(numpy.ndarray): (rows, columns) gathered values
+    """
+    known = (rows[:, None] >= 0) & (columns[None, :] >= 0)
+    if matrix.size == 0:
+        return numpy.full(known.shape, default, dtype=matrix.dtype)
+    return numpy.where(known, matrix[rows.clip(0)[:, None], columns.clip(0)[None, :]], default)
+
+
+def score_attentiveness(values, looking, thresholds, bounds, web_bias=None):
+    """The nervousness scoring of Bias_Nervousness_Model as array math; every
+       threshold may be a scalar or an array broadcasting against (users, combatants),
+       e.g. (settings, 1, 1) to score a whole grid of thresholds at once
+        Args:
+            values(numpy.ndarray): (users, 3) mean distance, stillness and angular stillness
+            looking(array-like): (users, combatants) percentage_looking_at_face values
+            thresholds(dict): values for every key of THRESHOLDS
+            bounds(dict): bounds as returned by calculate_bounds
+            web_bias(array-like): (users, combatants) web registration bias answers;
+                                  when given the web_reg variant of the scoring is used
+        Return:
+            scores(dict): "score" holds the -1/0/1 int8 scores; plus the adjusted
+                          "stillness" and "distance", or the adjusted "value" for web_reg
+    """
+    lower_bound = bounds["lower_bound"] if thresholds["lower_bound"] is None else thresholds["lower_bound"]
+    upper_bound = bounds["upper_bound"] if thresholds["upper_bound"] is None else thresholds["upper_bound"]
+    looking_away = numpy.asarray(looking) < thresholds["looking_at_face"]
+    mean_distance = values[:, 0:1]
+    stillness = values[:, 1:2]
+    angular_stillness = values[:, 2:3]
+
+    if web_bias is not None:
+        value = angular_stillness + stillness + mean_distance
+        # looking away: +1/+2 MEAN_STD below the lower bound, +2/+3 above, one more if biased
+        multiplier = (numpy.where(value < lower_bound, thresholds["web_reg_below"], thresholds["web_reg_above"]) +
+                      numpy.asarray(web_bias) * thresholds["web_reg_biased"])
+        adjusted_value = numpy.where(looking_away, value + multiplier * bounds["overall_mean_std"], value)
+        score = numpy.where(adjusted_value < lower_bound, -1, numpy.where(adjusted_value < upper_bound, 0, 1))
+        return {"score": score.astype(numpy.int8), "value": adjusted_value}
+
+    (stillness_mean_std, stillness_upper_bound, stillness_lower_bound) = (
+        bounds["stillness"]["overall_stillness_mean_std"],
+        bounds["stillness"]["overall_stillness_upper_bound"],
+        bounds["stillness"]["overall_stillness_lower_bound"])
+    (distance_mean_std, distance_upper_bound, distance_lower_bound) = (
+        bounds["distance"]["distance_mean_std"],
+        bounds["distance"]["distance_upper_bound"],
+        bounds["distance"]["distance_lower_bound"])
+    attentiveness_stillness = angular_stillness + stillness
+    attentiveness_distance = mean_distance
+    standing_far = ~looking_away & (attentiveness_distance > thresholds["far_distance"] * distance_mean_std)
+    with numpy.errstate(divide="ignore"):
+        adjusted_stillness = numpy.where(looking_away,
+                                         1.0 / (attentiveness_stillness + thresholds["away_stillness"] * stillness_mean_std),
+                                         numpy.where(standing_far,
+                                                     1.0 / (attentiveness_stillness + thresholds["far_stillness"] * stillness_mean_std),
+                                                     attentiveness_stillness))
+        adjusted_distance = numpy.where(looking_away,
+                                        1.0 / attentiveness_distance,
+                                        numpy.where(standing_far,
+                                                    1.0 / (attentiveness_distance + thresholds["far_distance_offset"] * distance_mean_std),
+                                                    attentiveness_distance))
+    # the lower bounds are checked first in the scalar path, so -1 wins over 1
+    low = (adjusted_distance < distance_lower_bound) | (adjusted_stillness < stillness_lower_bound)
+    high = (adjusted_distance > distance_upper_bound) | (adjusted_stillness > stillness_upper_bound)
+    score = numpy.where(low, -1, numpy.where(high, 1, 0))
+    return {"score": score.astype(numpy.int8), "stillness": adjusted_stillness, "distance": adjusted_distance}
+
+
+class Cohort_Store():
+    """Per-user session table: one fixed-size record per user in a structured numpy
+       array holding the attentiveness aggregates (columns mean_distance, stillness,
+       angular_stillness), the sky state and the 3-conflict "B"/"N"/"1" trajectory;
+       rows are looked up by user_id. Rows of completed sessions (loaded history
+       included) are marked finished and may be archived; writing a row reopens it
+    """
+    COLUMNS = ("mean_distance", "stillness", "angular_stillness")
+    CONFLICTS = 3
+    DTYPE = numpy.dtype([("values", numpy.float64, (len(COLUMNS),)),
+                         ("sky_level", numpy.int8),
+                         ("sky_last_step", numpy.float64),
+                         ("trajectory", "S1", (CONFLICTS,)),
+                         ("finished", numpy.bool_),
+                         # Running_Stats.updates when the row's session was counted, -1 if it is not
+                         ("stats_update", numpy.int64)])
+    # older exports prefix the stillness columns with "mean_"
+    ALIASES = {"mean_distance": "mean_distance",
+               "stillness": "mean_stillness",
+               "angular_stillness": "mean_angular_stillness"}
 
     def __init__(self, user_data):
-        self.user_data = user_data  # includes angular stillness, stillness, and mean distance
-        self.prev_states = {}
-        self.bias_per_conflict = {conflict_name_1: [], conflict_name_1: [], conflict_name_1: []}
-        bounds = self.calculate_bounds(user_data)
+        """Builds the table from per-user dicts
+            Args:
+                user_data(list or dict): per-user dicts including angular stillness,
+                                         stillness, and mean distance; a list is
+                                         indexed by position unless the dicts carry
+                                         a "user_id", a dict is indexed by its keys
+        """
+        if isinstance(user_data, dict):
+            user_ids = list(user_data)
+            users = list(user_data.values())
+        else:
+            users = list(user_data)
+            user_ids = [user.get("user_id", row) for row, user in enumerate(users)]
+        self._fill(user_ids, *[self._column(users, name) for name in self.COLUMNS])
+
+    @classmethod
+    def _column(cls, users, name):
+        # one list comprehension per column; the alias lookup only runs for older exports
+        try:
+            return [user[name] for user in users]
+        except KeyError:
+            alias = cls.ALIASES[name]
+            return [user[name] if name in user else user[alias] for user in users]
+
+    def _fill(self, user_ids, mean_distance, stillness, angular_stillness):
+        # every row starts as a finished session already counted in the running moments
+        self.index = dict(zip(user_ids, range(len(user_ids))))
+        self._set_buffer(self.empty(len(user_ids)))
+        self._buffer["values"] = numpy.column_stack([numpy.asarray(mean_distance, dtype=float),
+                                                     numpy.asarray(stillness, dtype=float),
+                                                     numpy.asarray(angular_stillness, dtype=float)]
+                                                    ).reshape(-1, len(self.COLUMNS))
+        self._buffer["stats_update"] = 0
+        self._buffer["finished"] = True
+        self._size = len(self._buffer)
+        self.finished_count = self._size
+
+    def _set_buffer(self, records):
+        # field views are cached since indexing them is much cheaper than a record's fields
+        self._buffer = records
+        self.sky_level = records["sky_level"]
+        self.sky_last_step = records["sky_last_step"]
+
+    @classmethod
+    def empty(cls, size):
+        records = numpy.zeros(size, dtype=cls.DTYPE)
+        records["sky_last_step"] = numpy.nan
+        records["stats_update"] = -1
+        return records
+
+    @classmethod
+    def from_arrays(cls, user_ids, mean_distance, stillness, angular_stillness):
+        """Builds a store directly from columns without going through dicts
+            Args:
+                user_ids(sequence): id of the user for each row
+                mean_distance, stillness, angular_stillness(array-like): one value per user
+            Return:
+                store(Cohort_Store)
+        """
+        store = cls([])
+        store._fill(list(user_ids), mean_distance, stillness, angular_stillness)
+        return store
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self.index
+
+    @property
+    def records(self):
+        """Structured view of the stored rows; spare capacity past the last row is hidden"""
+        return self._buffer[:self._size]
+
+    @property
+    def values(self):
+        """(n, 3) float view of the aggregates of the stored rows"""
+        return self._buffer["values"][:self._size]
+
+    def set(self, user_id, values):
+        """Stores a user's aggregates, overwriting them if the user is already known;
+           new users are appended into spare capacity (amortized constant time)
+            Args:
+                user_id(int): id of the user of interest
+                values(array-like): mean distance, stillness and angular stillness
+            Return:
+                row(int): row number the user is stored at
+        """
+        row = self.index.get(user_id)
+        if row is None:
+            if self._size == len(self._buffer):
+                grown = self.empty(max(16, 2 * len(self._buffer)))
+                grown[:self._size] = self._buffer[:self._size]
+                self._set_buffer(grown)
+            row = self._size
+            self._size += 1
+            self.index[user_id] = row
+        elif self._buffer["finished"][row]:
+            # a new session is writing the row, so it must not be archived mid-encounter
+            self._buffer["finished"][row] = False
+            self.finished_count -= 1
+        self._buffer["values"][row] = values
+        return row
+
+    @property
+    def mean_distance(self):
+        return self.values[:, 0]
+
+    @property
+    def stillness(self):
+        return self.values[:, 1]
+
+    @property
+    def angular_stillness(self):
+        return self.values[:, 2]
+
+    def row(self, user_id):
+        """Looks up a user's aggregates
+            Args:
+                user_id(int): id of the user of interest
+            Return:
+                row(numpy.ndarray): mean distance, stillness and angular stillness
+        """
+        return self._buffer["values"][self.index[user_id]]
+
+    def rows(self, user_ids):
+        """Translates user ids into row numbers for vectorized lookups
+            Args:
+                user_ids(sequence): ids of the users of interest
+            Return:
+                rows(numpy.ndarray): row number of each user
+        """
+        index = self.index
+        return numpy.fromiter((index[user_id] for user_id in user_ids), dtype=numpy.intp,
+                              count=len(user_ids))
+
+    def set_trajectory(self, user_id, conflict_index, state):
+        """Records the user's "B"/"N"/"1" state for one of the conflicts
+        """
+        self._buffer["trajectory"][self.index[user_id], conflict_index] = state
+
+    def trajectory(self, user_id):
+        """Return:
+               trajectory(list): the user's states for the conflicts reached so far
+        """
+        return [state.decode() for state in self._buffer["trajectory"][self.index[user_id]] if state]
+
+    def finish(self, user_id):
+        """Marks a user's session as finished so the row can be archived
+        """
+        row = self.index[user_id]
+        if not self._buffer["finished"][row]:
+            self._buffer["finished"][row] = True
+            self.finished_count += 1
+
+    def evict_finished(self):
+        """Removes every finished session and compacts the table
+            Return:
+                evicted(list): (user_id, record) pairs of the removed rows
+        """
+        finished = self.records["finished"]
+        if not finished.any():
+            return []
+        user_ids = numpy.empty(self._size, dtype=object)
+        for user_id, row in self.index.items():
+            user_ids[row] = user_id
+        evicted = list(zip(user_ids[finished], self.records[finished].copy()))
+        kept = ~finished
+        self._set_buffer(self._buffer[:self._size][kept].copy())
+        self._size = len(self._buffer)
+        self.finished_count = 0
+        self.index = {user_id: row for row, user_id in enumerate(user_ids[kept])}
+        return evicted
+
+
+class Running_Stats():
+    """Welford-style running mean and variance of the three cohort columns; updates
+       and merges are constant time, and an optional decay factor turns the moments
+       into an exponentially weighted window so old cohorts age out
+    """
+
+    def __init__(self, decay=None):
+        """
+            Args:
+                decay(float): weight kept by the existing history each time a session
+                              is added, e.g. 0.999 gives old sessions a half life of
+                              roughly 700 sessions; None keeps every session at full weight
+        """
+        if decay is not None and not 0 < decay <= 1:
+            raise ValueError("decay must be in (0, 1], got %r" % (decay,))
+        self.decay = decay
+        self.updates = 0
+        self.weight = 0.0
+        self.mean = numpy.zeros(len(Cohort_Store.COLUMNS))
+        self.m2 = numpy.zeros(len(Cohort_Store.COLUMNS))
+
+    @classmethod
+    def from_values(cls, values, decay=None):
+        """Seeds the moments from a block of rows in one vectorized pass; the block is
+           treated as a single undecayed batch
+            Args:
+                values(numpy.ndarray): (n, 3) rows of mean distance, stillness and
+                                       angular stillness
+                decay(float): see __init__
+            Return:
+                stats(Running_Stats)
+        """
+        stats = cls(decay)
+        if len(values):
+            stats.weight = float(len(values))
+            stats.mean, variance = column_moments(values)
+            stats.m2 = variance * len(values)
+        return stats
+
+    def update(self, values):
+        """Adds one finished session
+            Args:
+                values(array-like): mean distance, stillness and angular stillness
+        """
+        values = numpy.asarray(values, dtype=float)
+        if self.decay is not None:
+            self.weight *= self.decay
+            self.m2 *= self.decay
+        self.weight += 1.0
+        self.updates += 1
+        delta = values - self.mean
+        self.mean = self.mean + delta / self.weight
+        self.m2 = self.m2 + delta * (values - self.mean)
+
+    def remove(self, values, since=0):
+        """Takes back a session added earlier, e.g. when the same user's session is
+           recorded again (the inverse of update)
+            Args:
+                values(array-like): mean distance, stillness and angular stillness
+                since(int): value of updates when the session was added (0 for the
+                            seeded rows); with decay the session has aged since then
+        """
+        weight = 1.0 if self.decay is None else self.decay ** (self.updates - since)
+        values = numpy.asarray(values, dtype=float)
+        remaining = self.weight - weight
+        if remaining <= 1e-12:
+            self.weight = 0.0
+            self.mean = numpy.zeros_like(self.mean)
+            self.m2 = numpy.zeros_like(self.m2)
+            return
+        mean = (self.weight * self.mean - weight * values) / remaining
+        self.m2 = numpy.maximum(self.m2 - weight * (values - mean) * (values - self.mean), 0.0)
+        self.mean = mean
+        self.weight = remaining
+
+    def merge(self, other):
+        """Folds in the partial aggregate of another site (Chan et al. pairwise update)
+            Args:
+                other(Running_Stats): aggregate to combine with this one
+        """
+        if other.weight == 0:
+            return
+        if self.weight == 0:
+            self.weight, self.mean, self.m2 = other.weight, other.mean.copy(), other.m2.copy()
+            return
+        weight = self.weight + other.weight
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.weight / weight)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.weight * other.weight / weight)
+        self.weight = weight
+
+    def variance(self):
+        """Return:
+               variance(numpy.ndarray): population variance of each column
+        """
+        if self.weight == 0:
+            return numpy.zeros_like(self.mean)
+        return self.m2 / self.weight
+
+    def bounds(self):
+        """Return:
+               bounds(dict): same layout as Bias_Nervousness_Model.calculate_bounds
+        """
+        return bounds_from_moments(self.mean, numpy.sqrt(self.variance()))
+
+
+class Gaze_Index():
+    """Bounding spheres of the combatants' heads per scene, used to hit-test gaze rays
+       in bulk, plus per-user counts of frames spent looking at each combatant's face
+    """
+
+    def __init__(self):
+        self.scenes = {}
+        self.combatants = {}
+        self.users = {}
+        # frame counts, kept as floats so precomputed percentages can be loaded too
+        self.looked = numpy.zeros((0, 0))
+        self.seen = numpy.zeros((0, 0))
+
+    def _combatant_column(self, combatant_name):
+        column = self.combatants.get(combatant_name)
+        if column is None:
+            column = self.combatants[combatant_name] = len(self.combatants)
+            extra = ((0, 0), (0, len(self.combatants) - self.looked.shape[1]))
+            self.looked = numpy.pad(self.looked, extra)
+            self.seen = numpy.pad(self.seen, extra)
+        return column
+
+    def add_scene(self, scene, heads):
+        """Registers the head volumes of the combatants present in a scene
+            Args:
+                scene(str): name of the scene
+                heads(dict): {combatant_name: (center(x, y, z), radius)} in meters
+        """
+        names = list(heads)
+        for combatant_name in names:
+            self._combatant_column(combatant_name)
+        columns = numpy.array([self.combatants[name] for name in names], dtype=numpy.intp)
+        centers = numpy.array([heads[name][0] for name in names], dtype=float).reshape(-1, 3)
+        radii = numpy.array([heads[name][1] for name in names], dtype=float)
+        self.scenes[scene] = (columns, centers, radii ** 2)
+
+    def _user_row(self, user_id):
+        row = self.users.get(user_id)
+        if row is None:
+            row = self.users[user_id] = len(self.users)
+            if row == len(self.looked):
+                extra = ((0, max(16, len(self.looked))), (0, 0))
+                self.looked = numpy.pad(self.looked, extra)
+                self.seen = numpy.pad(self.seen, extra)
+        return row
+
+    def forget(self, user_ids):
+        """Drops the counts of users whose sessions were archived
+            Args:
+                user_ids(sequence): ids of the users to drop
+        """
+        rows = [self.users.pop(user_id) for user_id in user_ids if user_id in self.users]
+        if not rows:
+            return
+        size = len(self.users) + len(rows)
+        kept = numpy.ones(size, dtype=bool)
+        kept[rows] = False
+        self.looked = self.looked[:size][kept]
+        self.seen = self.seen[:size][kept]
+        remap = numpy.cumsum(kept) - 1
+        self.users = {user_id: int(remap[row]) for user_id, row in self.users.items()}
+
+    def hits(self, scene, origins, directions):
+        """Intersects a block of gaze rays with every head volume of a scene
+            Args:
+                scene(str): name of the scene the frames were recorded in
+                origins(numpy.ndarray): (frames, 3) ray origins (head positions)
+                directions(numpy.ndarray): (frames, 3) ray directions, need not be unit length
+            Return:
+                hits(numpy.ndarray): (frames, combatants in scene) booleans
+        """
+        columns, centers, radii_sq = self.scenes[scene]
+        # vector from each ray origin to each head center: (frames, heads, 3)
+        to_center = centers[None, :, :] - origins[:, None, :]
+        direction_sq = numpy.einsum("ij,ij->i", directions, directions)[:, None]
+        along = numpy.einsum("ijk,ik->ij", to_center, directions)
+        center_sq = numpy.einsum("ijk,ijk->ij", to_center, to_center)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            # squared distance between the head center and the closest point on the ray
+            miss_sq = center_sq - along ** 2 / direction_sq
+        return (center_sq <= radii_sq) | ((along >= 0) & (miss_sq <= radii_sq))
+
+    def record(self, user_id, scene, origins, directions):
+        """Hit-tests a block of a user's frames and adds them to the cached counts;
+           writes go through Bias_Nervousness_Model.record_gaze to drop cached scores
+            Args:
+                user_id(int): id of the user wearing the headset
+                scene(str): name of the scene the frames were recorded in
+                origins(numpy.ndarray): (frames, 3) ray origins (head positions)
+                directions(numpy.ndarray): (frames, 3) ray directions
+        """
+        if len(origins) == 0:
+            return
+        columns = self.scenes[scene][0]
+        row = self._user_row(user_id)
+        self.looked[row, columns] += self.hits(scene, origins, directions).sum(axis=0)
+        self.seen[row, columns] += len(origins)
+
+    def set_percentage(self, combatant_name, user_id, percentage):
+        """Replaces a user's counts for a combatant with a precomputed percentage, e.g.
+           when re-analysing archived sessions whose frames are no longer at hand
+           (see Bias_Nervousness_Model.set_looking_at_face)
+        """
+        row = self._user_row(user_id)
+        column = self._combatant_column(combatant_name)
+        self.looked[row, column] = percentage
+        self.seen[row, column] = 1.0
+
+    def percentage(self, combatant_name, user_id):
+        """Return:
+               percentage(float): share of the user's frames in scenes with the
+                                  combatant spent looking at the combatant's face;
+                                  1.0 when no such frames were recorded
+        """
+        row = self.users.get(user_id)
+        column = self.combatants.get(combatant_name)
+        if row is None or column is None or self.seen[row, column] == 0:
+            return 1.0
+        return self.looked[row, column] / float(self.seen[row, column])
+
+    def percentages(self, user_ids, combatant_names):
+        """Vectorized percentage over every user/combatant pair
+            Return:
+                percentages(numpy.ndarray): (users, combatants) floats
+        """
+        rows = numpy.array([self.users.get(user_id, -1) for user_id in user_ids], dtype=numpy.intp)
+        columns = numpy.array([self.combatants.get(name, -1) for name in combatant_names],
+                              dtype=numpy.intp)
+        looked = lookup_pairs(self.looked, rows, columns, 0)
+        seen = lookup_pairs(self.seen, rows, columns, 0)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return numpy.where(seen > 0, looked / seen, 1.0)
+
+
+class Sky_Engine():
+    """Drives the cloud/brightness state for each headset at frame rate; every
+       step_seconds the opacity moves one step of 1/15 up (nervous) or down (not
+       nervous), so continuous nervousness takes the sky from fully sunny to fully
+       cloudy over roughly 7.5 minutes. Each user's opacity step and the time it last
+       moved live in their model.cohort record; between steps a tick is a lookup
+    """
+    STEPS = 15
+    OPACITY = tuple(level / 15.0 for level in range(16))
+
+    def __init__(self, model, step_seconds=30.0):
+        """
+            Args:
+                model(Bias_Nervousness_Model): model providing the cohort, gaze and bounds
+                step_seconds(float): seconds between opacity steps (7.5 minutes / 15)
+        """
+        self.model = model
+        self.step_seconds = step_seconds
+        self.refresh()
+
+    def refresh(self):
+        """Copies the model's current bounds into the thresholds used on each tick
+        """
+        model = self.model
+        thresholds = model.thresholds
+        self.version = model.bounds_version
+        self.thresholds = (thresholds["looking_at_face"],
+                           thresholds["away_stillness"] * model.STILLNESS_MEAN_STD,
+                           thresholds["far_stillness"] * model.STILLNESS_MEAN_STD,
+                           thresholds["far_distance_offset"] * model.DISTANCE_MEAN_STD,
+                           thresholds["far_distance"] * model.DISTANCE_MEAN_STD,
+                           model.STILLNESS_LOWER_BOUND, model.STILLNESS_UPPER_BOUND,
+                           model.DISTANCE_LOWER_BOUND, model.DISTANCE_UPPER_BOUND)
+
+    def nervous(self, combatant_name, user_id):
+        """Same decision as nervous_toward_combatant_score(...) != 0, on plain floats
+            Args:
+                combatant_name(str): name of a combatant
+                user_id(int): id of the user of interest
+            Return:
+                boolean representing if the user is nervous towards the combatant
+        """
+        if self.version != self.model.bounds_version:
+            self.refresh()
+        (looking_at_face, away_stillness, far_stillness, far_distance_offset, far_distance,
+         stillness_lower, stillness_upper, distance_lower, distance_upper) = self.thresholds
+        cohort = self.model.cohort
+        distance, stillness, angular_stillness = cohort.row(user_id).tolist()
+        stillness = angular_stillness + stillness
+        # a zero denominator gives inf, as the numpy scalars of the scoring methods do
+        if self.model.gaze.percentage(combatant_name, user_id) < looking_at_face:
+            stillness += away_stillness
+            stillness = 1.0 / stillness if stillness else float("inf")
+            distance = 1.0 / distance if distance else float("inf")
+        elif distance > far_distance:
+            stillness += far_stillness
+            stillness = 1.0 / stillness if stillness else float("inf")
+            distance += far_distance_offset
+            distance = 1.0 / distance if distance else float("inf")
+        return (distance < distance_lower or stillness < stillness_lower or
+                distance > distance_upper or stillness > stillness_upper)
+
+    def tick(self, user_id, combatant_name, now=None):
+        """Advances a user's sky if a step is due and returns its opacity
+            Args:
+                user_id(int): id of the user wearing the headset
+                combatant_name(str): combatant the user is currently facing
+                now(float): current time in seconds; defaults to time.monotonic()
+            Return:
+                sky_environment(float): see Bias_Nervousness_Model.sky_change_test;
+                                        fully sunny until the user has a row in the
+                                        session table (e.g. the first second of a
+                                        live session)
+        """
+        if now is None:
+            now = time.monotonic()
+        cohort = self.model.cohort
+        row = cohort.index.get(user_id)
+        if row is None:
+            return self.OPACITY[0]
+        last_step = cohort.sky_last_step[row]
+        if last_step != last_step:  # NaN: first tick of the session
+            cohort.sky_last_step[row] = now
+        elif now - last_step >= self.step_seconds:
+            cohort.sky_last_step[row] = now
+            level = cohort.sky_level[row]
+            nervous = self.nervous(combatant_name, user_id)
+            if self.model.probe is not None:
+                self.model.probe.branch("sky.nervous" if nervous else "sky.calm")
+            if nervous:
+                if level < self.STEPS:
+                    cohort.sky_level[row] = level + 1
+            elif level > 0:
+                cohort.sky_level[row] = level - 1
+        return self.OPACITY[cohort.sky_level[row]]
+
+    def reset(self, user_id):
+        """Forgets a user's sky state, e.g. when their session ends
+        """
+        cohort = self.model.cohort
+        row = cohort.index.get(user_id)
+        if row is not None:
+            cohort.sky_level[row] = 0
+            cohort.sky_last_step[row] = numpy.nan
+
+
+class Web_Registration_Table():
+    """Web registration survey answers loaded once from a bulk export into compact
+       per-user arrays: the answer to each question (0 when unanswered), whether the
+       survey was completed, and the bias test result (Questions 2-4) per combatant
+    """
+    QUESTIONS = 4
+    TRUE_VALUES = ("1", "true", "yes", "y", "t")
+
+    def __init__(self):
+        self.users = {}
+        self.combatants = {}
+        self.completed = numpy.zeros(0, dtype=bool)
+        self.answers = numpy.zeros((0, self.QUESTIONS), dtype=numpy.int8)
+        self.bias_flags = numpy.zeros((0, 0), dtype=bool)
+
+    @classmethod
+    def from_records(cls, records):
+        """Builds the table from per-user records
+            Args:
+                records(list): {"user_id": ..., "completed": bool,
+                                "answers": {"question_1": "3", ...},
+                                "bias": {combatant_name: bool, ...}}
+            Return:
+                table(Web_Registration_Table)
+        """
+        table = cls()
+        for record in records:
+            for combatant_name in record.get("bias", {}):
+                table.combatants.setdefault(combatant_name, len(table.combatants))
+        table.completed = numpy.zeros(len(records), dtype=bool)
+        table.answers = numpy.zeros((len(records), cls.QUESTIONS), dtype=numpy.int8)
+        table.bias_flags = numpy.zeros((len(records), len(table.combatants)), dtype=bool)
+        for row, record in enumerate(records):
+            table.users[record["user_id"]] = row
+            table.completed[row] = cls.flag(record.get("completed", False))
+            for question in range(cls.QUESTIONS):
+                answer = record.get("answers", {}).get("question_%d" % (question + 1))
+                if answer not in (None, ""):
+                    table.answers[row, question] = int(answer)
+            for combatant_name, biased in record.get("bias", {}).items():
+                table.bias_flags[row, table.combatants[combatant_name]] = cls.flag(biased)
+        return table
+
+    @classmethod
+    def from_json(cls, path):
+        """Loads a JSON export holding a list of records (see from_records)
+        """
+        with open(path) as handle:
+            return cls.from_records(json.load(handle))
+
+    @classmethod
+    def from_csv(cls, path):
+        """Loads a CSV export with the columns user_id, completed, question_1..question_4
+           and one bias_<combatant_name> column per combatant
+        """
+        records = []
+        with open(path, newline="") as handle:
+            for line in csv.DictReader(handle):
+                user_id = line.pop("user_id")
+                records.append({"user_id": int(user_id) if user_id.isdigit() else user_id,
+                                "completed": line.pop("completed", False),
+                                "answers": {key: value for key, value in line.items()
+                                            if key.startswith("question_")},
+                                "bias": {key[len("bias_"):]: value for key, value in line.items()
+                                         if key.startswith("bias_")}})
+        return cls.from_records(records)
+
+    @classmethod
+    def flag(cls, value):
+        if isinstance(value, str):
+            return value.strip().lower() in cls.TRUE_VALUES
+        return bool(value)
+
+    def bias(self, combatant_name, user_id):
+        """Return:
+               boolean representing if the user reported a bias towards the combatant
+        """
+        row = self.users.get(user_id)
+        column = self.combatants.get(combatant_name)
+        if row is None or column is None:
+            return False
+        return bool(self.bias_flags[row, column])
+
+    def bias_matrix(self, user_ids, combatant_names):
+        """Vectorized bias over every user/combatant pair
+            Return:
+                web_bias(numpy.ndarray): (users, combatants) booleans
+        """
+        rows = numpy.array([self.users.get(user_id, -1) for user_id in user_ids], dtype=numpy.intp)
+        columns = numpy.array([self.combatants.get(name, -1) for name in combatant_names],
+                              dtype=numpy.intp)
+        return lookup_pairs(self.bias_flags, rows, columns, False)
+
+    def epilogue_cases(self, user_ids):
+        """Vectorized epilogue case selection (see Bias_Nervousness_Model.epilogue_intro)
+            Return:
+                case_ids(numpy.ndarray): case id 0-5 per user
+        """
+        rows = numpy.array([self.users.get(user_id, -1) for user_id in user_ids], dtype=numpy.intp)
+        first = numpy.zeros(1, dtype=numpy.intp)
+        question_1 = lookup_pairs(self.answers, rows, first, 0)[:, 0]
+        completed = lookup_pairs(self.completed[:, None], rows, first, False)[:, 0]
+        return numpy.where(completed & (question_1 >= 1) & (question_1 <= 5), question_1, 0).astype(numpy.int8)
+
+
+class Score_Cache():
+    """Bounded LRU cache of per-user scores keyed by (user_id, combatant_name, variant)
+       where variant is "plain" or "web_reg"; entries are dropped per user when that
+       user's sensor aggregates change and all at once when the bounds shift
+    """
+
+    def __init__(self, maxsize=65536):
+        """
+            Args:
+                maxsize(int): number of scores kept before the least recently used is evicted
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return:
+               score(int): the cached score, or None on a miss
+        """
+        score = self.entries.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return score
+
+    def put(self, key, score):
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        self.user_keys.setdefault(key[0], set()).add(key)
+        if len(self.entries) > self.maxsize:
+            evicted, _ = self.entries.popitem(last=False)
+            keys = self.user_keys[evicted[0]]
+            keys.discard(evicted)
+            if not keys:
+                del self.user_keys[evicted[0]]
+
+    def invalidate_user(self, user_id):
+        for key in self.user_keys.pop(user_id, ()):
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+        self.user_keys.clear()
+
+    def counters(self):
+        """Return:
+               counters(dict): hits, misses and current size
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+class Latency_Histogram():
+    """Cumulative-style latency histogram with fixed buckets (seconds)
+    """
+    BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+               1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        bucket = 0
+        for bucket, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            bucket = len(self.BUCKETS)
+        self.counts[bucket] += 1
+        self.total += seconds
+        self.count += 1
+
+    def snapshot(self):
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.BUCKETS + (float("inf"),), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {"buckets": buckets, "sum": self.total, "count": self.count}
+
+
+class Instrumentation():
+    """Opt-in call counts, latency histograms and branch-taken counters for a model.
+       Enabling wraps the model's public methods on the instance; disabling removes
+       the wrappers again, so a model that was never instrumented runs the plain
+       methods and only pays one attribute test per counted branch
+    """
+    METHODS = ("calculate_bounds", "end_session", "percentage_looking_at_face",
+               "nervous_toward_combatant", "nervous_toward_combatant_web_reg",
+               "nervous_toward_combatant_score", "nervous_toward_combatant_score_web_reg",
+               "score_matrix", "biased_toward_combatant", "biased_toward_combatant_web_reg",
+               "biased_toward_either", "biased_toward_either_web_reg",
+               "biased_toward_which", "biased_toward_which_web_reg",
+               "negative_bias_toward_either", "negative_bias_toward_either_web_reg",
+               "sky_change_test", "epilogue_intro", "epilogue_cases",
+               "user_state_trajectory", "post_epilogue_transformation_mirror")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.latency = {}
+        self.branches = {}
+        self.model = None
+
+    def enable(self, model):
+        """Wraps the model's methods and routes its branch counters here
+            Args:
+                model(Bias_Nervousness_Model): model to instrument
+        """
+        self.model = model
+        for name in self.METHODS:
+            setattr(model, name, self.wrap(name, getattr(model, name)))
+        model.probe = self
+
+    def disable(self):
+        """Restores the plain methods on the model
+        """
+        for name in self.METHODS:
+            self.model.__dict__.pop(name, None)
+        self.model.probe = None
+        self.model = None
+
+    def wrap(self, name, method):
+        histogram = self.latency.setdefault(name, Latency_Histogram())
+        self.calls.setdefault(name, 0)
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                with self.lock:
+                    self.calls[name] += 1
+                    histogram.observe(elapsed)
+        timed.__name__ = name
+        timed.__doc__ = method.__doc__
+        return timed
+
+    def branch(self, name):
+        with self.lock:
+            self.branches[name] = self.branches.get(name, 0) + 1
+
+    def snapshot(self):
+        """Return:
+               snapshot(dict): {"calls": {...}, "latency": {...}, "branches": {...}}
+        """
+        with self.lock:
+            return {"time": time.time(),
+                    "calls": dict(self.calls),
+                    "latency": {name: histogram.snapshot() for name, histogram in self.latency.items()},
+                    "branches": dict(self.branches)}
+
+    def dump(self, path):
+        """Writes a JSON snapshot to a local file
+        """
+        with open(path, "w") as handle:
+            json.dump(self.snapshot(), handle, indent=2)
+
+    def prometheus_text(self):
+        """Return:
+               text(str): the snapshot in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = ["# TYPE enemy_method_calls_total counter"]
+        for name, count in sorted(snapshot["calls"].items()):
+            lines.append('enemy_method_calls_total{method="%s"} %d' % (name, count))
+        lines.append("# TYPE enemy_method_latency_seconds histogram")
+        for name, histogram in sorted(snapshot["latency"].items()):
+            for bound, count in histogram["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('enemy_method_latency_seconds_bucket{method="%s",le="%s"} %d' % (name, le, count))
+            lines.append('enemy_method_latency_seconds_sum{method="%s"} %r' % (name, histogram["sum"]))
+            lines.append('enemy_method_latency_seconds_count{method="%s"} %d' % (name, histogram["count"]))
+        lines.append("# TYPE enemy_branch_taken_total counter")
+        for name, count in sorted(snapshot["branches"].items()):
+            lines.append('enemy_branch_taken_total{branch="%s"} %d' % (name, count))
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port=9108, host="127.0.0.1"):
+        """Serves prometheus_text() at http://host:port/metrics from a daemon thread
+            Return:
+                server(ThreadingHTTPServer): call shutdown() to stop it
+        """
+        instrumentation = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = instrumentation.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Bias_Nervousness_Model():
+
+    def __init__(self, user_data, decay=None, max_resident=None, archive_path=None,
+                 thresholds=None, bounds=None, stats=None):
+        """
+            Args:
+                user_data(list or dict): per-user aggregates (see Cohort_Store)
+                decay(float): decay of the running bounds (see Running_Stats)
+                max_resident(int): once the session table holds more users than this,
+                                   finished sessions (loaded history included) are
+                                   archived out of memory in batches of at least
+                                   max_resident // 2; the running bounds keep their
+                                   contribution but calculate_bounds only sees
+                                   resident users
+                archive_path(str): JSON lines file finished sessions are appended to
+                thresholds(dict): overrides of the module THRESHOLDS
+                bounds(dict): precomputed bounds (as returned by calculate_bounds) to
+                              use instead of computing them from user_data
+                stats(Running_Stats): running moments to continue from instead of
+                                      computing them from user_data
+        """
+        # includes angular stillness, stillness, and mean distance (or an already built Cohort_Store)
+        self.cohort = user_data if isinstance(user_data, Cohort_Store) else Cohort_Store(user_data)
+        # online moments so bounds can follow new sessions without a full recompute
+        self.stats = stats if stats is not None else Running_Stats.from_values(self.cohort.values, decay=decay)
+        self.gaze = Gaze_Index()
+        self.scores = Score_Cache()
+        self.web_registration = Web_Registration_Table()
+        self.conflicts = {}
+        self.max_resident = max_resident
+        self.archive_path = archive_path
+        unknown = set(thresholds or {}) - set(THRESHOLDS)
+        if unknown:
+            raise ValueError("unknown thresholds: %s" % ", ".join(sorted(unknown)))
+        self.thresholds = dict(THRESHOLDS, **(thresholds or {}))
+        self.bounds_version = 0
+        self.probe = None
+        self._set_bounds(bounds if bounds is not None else self.calculate_bounds())
+        self.sky = Sky_Engine(self)
+
+    def instrument(self):
+        """Turns on call counts, latency histograms and branch counters
+            Return:
+                instrumentation(Instrumentation)
+        """
+        if self.probe is None:
+            Instrumentation().enable(self)
+        return self.probe
+
+    def uninstrument(self):
+        if self.probe is not None:
+            self.probe.disable()
+
+    def save_snapshot(self, path):
+        """Saves the fitted state (bounds, thresholds, running moments, session table,
+           gaze counts and web registration tables) to a Snapshot_File
+            Args:
+                path(str): file to create
+        """
+        gaze = self.gaze
+        table = self.web_registration
+        # sky steps are timed on this process's monotonic clock, meaningless to the
+        # next one: a restored session's sky restarts its step timer on the first tick
+        records = self.cohort.records.copy()
+        records["sky_last_step"] = numpy.nan
+        state = {"bounds": self.bounds, "thresholds": self.thresholds,
+                 "finished_count": self.cohort.finished_count,
+                 "bounds_version": self.bounds_version, "conflicts": self.conflicts,
+                 "max_resident": self.max_resident, "archive_path": self.archive_path,
+                 "stats": {"decay": self.stats.decay, "updates": self.stats.updates,
+                           "weight": self.stats.weight,
+                           "mean": self.stats.mean.tolist(), "m2": self.stats.m2.tolist()},
+                 "gaze": {"combatants": list(gaze.combatants),
+                          "scenes": {scene: [columns.tolist(), centers.tolist(), radii_squared.tolist()]
+                                     for scene, (columns, centers, radii_squared) in gaze.scenes.items()}},
+                 "web_registration": {"combatants": list(table.combatants)}}
+        arrays = {"cohort.user_ids": Snapshot_File.id_array(self.cohort.index),
+                  "cohort.records": records,
+                  "gaze.user_ids": Snapshot_File.id_array(gaze.users),
+                  "gaze.looked": gaze.looked[:len(gaze.users)],
+                  "gaze.seen": gaze.seen[:len(gaze.users)],
+                  "web_registration.user_ids": Snapshot_File.id_array(table.users),
+                  "web_registration.completed": table.completed,
+                  "web_registration.answers": table.answers,
+                  "web_registration.bias_flags": table.bias_flags}
+        Snapshot_File.write(path, state, arrays)
+
+    @classmethod
+    def load_snapshot(cls, path):
+        """Restores a model saved by save_snapshot without recomputing anything; the
+           tables stay memory-mapped (copy on write) and are paged in as they are used
+            Args:
+                path(str): file written by save_snapshot
+            Return:
+                model(Bias_Nervousness_Model)
+        """
+        snapshot = Snapshot_File(path)
+        state = snapshot.state
+        cohort = Cohort_Store([])
+        cohort.index = Snapshot_File.id_index(snapshot.array("cohort.user_ids"))
+        cohort._set_buffer(snapshot.array("cohort.records"))
+        cohort._size = len(cohort.index)
+        cohort.finished_count = state["finished_count"]
+        stats = Running_Stats(state["stats"]["decay"])
+        stats.updates = state["stats"]["updates"]
+        stats.weight = state["stats"]["weight"]
+        stats.mean = numpy.array(state["stats"]["mean"])
+        stats.m2 = numpy.array(state["stats"]["m2"])
+        model = cls(cohort, decay=stats.decay, max_resident=state["max_resident"],
+                    archive_path=state["archive_path"], thresholds=state["thresholds"],
+                    bounds=state["bounds"], stats=stats)
+        model.bounds_version = state["bounds_version"]
+        model.conflicts = state["conflicts"]
+        gaze = model.gaze
+        gaze.combatants = {name: column for column, name in enumerate(state["gaze"]["combatants"])}
+        gaze.scenes = {scene: (numpy.array(columns, dtype=numpy.intp), numpy.array(centers).reshape(-1, 3),
+                               numpy.array(radii_squared))
+                       for scene, (columns, centers, radii_squared) in state["gaze"]["scenes"].items()}
+        gaze.users = Snapshot_File.id_index(snapshot.array("gaze.user_ids"))
+        gaze.looked = snapshot.array("gaze.looked")
+        gaze.seen = snapshot.array("gaze.seen")
+        table = model.web_registration
+        table.combatants = {name: column for column, name in
+                            enumerate(state["web_registration"]["combatants"])}
+        table.users = Snapshot_File.id_index(snapshot.array("web_registration.user_ids"))
+        table.completed = snapshot.array("web_registration.completed")
+        table.answers = snapshot.array("web_registration.answers")
+        table.bias_flags = snapshot.array("web_registration.bias_flags")
+        return model
+
+    def _set_bounds(self, bounds):
+        """Copies a bounds dict (as returned by calculate_bounds) onto the thresholds
+           used by the scoring methods
+        """
+        self.bounds = bounds
         self.LOWER_BOUND = bounds["lower_bound"]
         self.UPPER_BOUND = bounds["upper_bound"]
+        if self.thresholds["lower_bound"] is not None:
+            self.LOWER_BOUND = self.thresholds["lower_bound"]
+        if self.thresholds["upper_bound"] is not None:
+            self.UPPER_BOUND = self.thresholds["upper_bound"]
         self.MEAN_STD = bounds["overall_mean_std"]
+        self.STILLNESS_MEAN_STD = bounds["stillness"]["overall_stillness_mean_std"]
+        self.STILLNESS_UPPER_BOUND = bounds["stillness"]["overall_stillness_upper_bound"]
+        self.STILLNESS_LOWER_BOUND = bounds["stillness"]["overall_stillness_lower_bound"]
+        self.DISTANCE_MEAN_STD = bounds["distance"]["distance_mean_std"]
+        self.DISTANCE_UPPER_BOUND = bounds["distance"]["distance_upper_bound"]
+        self.DISTANCE_LOWER_BOUND = bounds["distance"]["distance_lower_bound"]
+        self.bounds_version += 1
+        self.scores.clear()
 
     def calculate_bounds(self):
         """Calculates the upper and lower bound thresholds for attentiveness
            Return:
-               bounds(dict): {"upper_bound": X, "lower_bound": Y, "overall_mean_std": Z}
-        """
-        # calculate mean and standard dev mean distance
-        all_mean_distances = [user["mean_distance"] for user in self.user_data]
-        mean_mean_distance = numpy.mean(all_mean_distances)
-        std_mean_distance = numpy.std(all_mean_distances)
-
-        # calculate mean and standard dev stillness
-        all_mean_stillnesses = [user["stillness"] for user in self.user_data]
-        mean_stillness = numpy.mean(all_mean_stillnesses)
-        std_stillness = numpy.std(all_mean_stillnesses)
-
-        # calculate mean and standard dev angular stillness
-        all_angular_stillnesses = [user["angular_stillness"] for user in self.user_data]
-        mean_angular_stillness = numpy.mean(all_angular_stillnesses)
-        std_angular_stillness = numpy.std(all_angular_stillnesses)
-
-        #overall stillness
-        overall_stillness_mean = mean_stillness + mean_angular_stillness
-        overall_stillness_mean_std = (std_stillness ** 2 + std_angular_stillness ** 2) ** 0.5
-
-        return {"stillness": {"overall_stillness_mean_std": overall_stillness_mean_std,
-                "overall_stillness_upper_bound": overall_stillness_mean + overall_stillness_mean_std,
-                "overall_stillness_lower_bound": overall_stillness_mean - overall_stillness_mean_std},
-                "distance": {"distance_mean_std": std_mean_distance,
-                "distance_upper_bound": mean_mean_distance + std_mean_distance,
-                "distance_lower_bound": mean_mean_distance - std_mean_distance}}
+               bounds(dict): {"upper_bound": X, "lower_bound": Y, "overall_mean_std": Z,
+                              "stillness": {...}, "distance": {...}}
+        """
+        # one pass over the cohort columns: mean distance, stillness, angular stillness
+        means, variances = column_moments(self.cohort.values)
+        return bounds_from_moments(means, numpy.sqrt(variances))
+
+    def end_session(self, user_id, mean_distance, stillness, angular_stillness):
+        """Records a finished session and updates the bounds in constant time
+            Args:
+                user_id(int): id of the user whose session ended
+                mean_distance(float): the session's mean distance
+                stillness(float): the session's mean stillness
+                angular_stillness(float): the session's mean angular stillness
+        """
+        values = (mean_distance, stillness, angular_stillness)
+        # a repeat session replaces the user's earlier one in the running moments
+        self.withdraw_session(user_id)
+        row = self.cohort.set(user_id, values)
+        self.stats.update(values)
+        self.cohort.records["stats_update"][row] = self.stats.updates
+        self.refresh_bounds()
+        self.sky.reset(user_id)
+        self.invalidate_user(user_id)
+        self.cohort.finish(user_id)
+        # archive in batches of at least half of max_resident, so the compaction
+        # (linear in the table) is amortized over that many sessions
+        if (self.max_resident is not None and len(self.cohort) > self.max_resident and
+                self.cohort.finished_count >= max(1, self.max_resident // 2)):
+            self.archive_finished()
+
+    def update_session(self, user_id, values):
+        """Writes a live session's partial aggregates into the session table; a
+           returning user's earlier session is first taken out of the running moments
+            Args:
+                user_id(int): id of the user of interest
+                values(array-like): mean distance, stillness and angular stillness so far
+        """
+        if self.withdraw_session(user_id):
+            self.refresh_bounds()
+        self.cohort.set(user_id, values)
+        self.invalidate_user(user_id)
+
+    def record_gaze(self, user_id, scene, origins, directions):
+        """Adds a block of a user's gaze rays to the looking-at-face counts and drops
+           the user's cached scores, which depend on them
+            Args:
+                user_id(int): id of the user wearing the headset
+                scene(str): name of the scene the frames were recorded in
+                origins(numpy.ndarray): (frames, 3) ray origins (head positions)
+                directions(numpy.ndarray): (frames, 3) ray directions
+        """
+        self.gaze.record(user_id, scene, origins, directions)
+        self.invalidate_user(user_id)
+
+    def set_looking_at_face(self, combatant_name, user_id, percentage):
+        """Replaces a user's looking-at-face share for a combatant and drops the
+           user's cached scores
+            Args:
+                combatant_name(str): name of the combatant
+                user_id(int): id of the user of interest
+                percentage(float): share of frames spent looking at the combatant's face
+        """
+        self.gaze.set_percentage(combatant_name, user_id, percentage)
+        self.invalidate_user(user_id)
+
+    def withdraw_session(self, user_id):
+        """Removes a user's counted session (seeded or ended here) from the running
+           moments; sessions already archived out of the table keep their contribution
+            Args:
+                user_id(int): id of the user of interest
+            Return:
+                withdrawn(bool): whether the moments changed
+        """
+        row = self.cohort.index.get(user_id)
+        if row is None:
+            return False
+        stats_update = self.cohort.records["stats_update"]
+        if stats_update[row] < 0:
+            return False
+        self.stats.remove(self.cohort.values[row], since=int(stats_update[row]))
+        stats_update[row] = -1
+        return True
+
+    def archive_finished(self):
+        """Moves every finished session out of the session table (appending it to
+           archive_path when set) and releases its gaze counts and cached scores
+            Return:
+                count(int): number of sessions archived
+        """
+        evicted = self.cohort.evict_finished()
+        if self.archive_path is not None and evicted:
+            with open(self.archive_path, "a") as archive:
+                for user_id, record in evicted:
+                    mean_distance, stillness, angular_stillness = record["values"].tolist()
+                    archive.write(json.dumps({"user_id": user_id, "mean_distance": mean_distance,
+                                              "stillness": stillness,
+                                              "angular_stillness": angular_stillness,
+                                              "trajectory": [state.decode() for state in record["trajectory"]]})
+                                  + "\n")
+        user_ids = [user_id for user_id, _ in evicted]
+        self.gaze.forget(user_ids)
+        for user_id in user_ids:
+            self.invalidate_user(user_id)
+        return len(evicted)
+
+    def conflict_index(self, conflict):
+        """Position of a conflict in the user state trajectory, in order of first use
+            Args:
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
+            Return:
+                index(int): 0, 1 or 2
+        """
+        index = self.conflicts.get(conflict["name"])
+        if index is None:
+            if len(self.conflicts) == Cohort_Store.CONFLICTS:
+                raise ValueError("only %d conflicts are tracked, got %r" % (Cohort_Store.CONFLICTS,
+                                                                          conflict["name"]))
+            index = self.conflicts[conflict["name"]] = len(self.conflicts)
+        return index
+
+    def invalidate_user(self, user_id):
+        """Drops a user's cached scores; call whenever their sensor aggregates change
+            Args:
+                user_id(int): id of the user of interest
+        """
+        self.scores.invalidate_user(user_id)
+
+    def refresh_bounds(self):
+        """Reinstalls the bounds from the running moments, the single source of the
+           bounds once the model is built (finished sessions only: live sessions are
+           withdrawn from the moments while they run)
+            Return:
+                bounds(dict): see calculate_bounds
+        """
+        self._set_bounds(self.stats.bounds())
+        return self.bounds
+
+    def merge_stats(self, other):
+        """Combines the running aggregate of another exhibit site into this model's bounds
+            Args:
+                other(Running_Stats): partial aggregate, e.g. another model's .stats
+        """
+        self.stats.merge(other)
+        self.refresh_bounds()
 
     def percentage_looking_at_face(self, combatant_name, user_id):
         """Calculates the percentage of time a user spends looking at a combatant's face
@@ -56,7 +1325,7 @@ class Bias_Nervousness_Model():
               Return:
                   percentage(float): percentage of time passed in combatant's face was looked at
         """
-        pass
+        return self.gaze.percentage(combatant_name, user_id)
 
     def nervous_toward_combatant(self, combatant_name, user_id):
         """Calculates a score representing the attention paid towards a given
@@ -72,24 +1341,53 @@ class Bias_Nervousness_Model():
         # self.LOWER_BOUND = bounds["lower_bound"]
         # self.UPPER_BOUND = bounds["upper_bound"]
         # float
-        percentage_looking_at_face = self.percentage_looking_at_face(combatant_name)
+        percentage_looking_at_face = self.percentage_looking_at_face(combatant_name, user_id)
         # float
+        mean_distance, stillness, angular_stillness = self.cohort.row(user_id)
         attentiveness_values = {
-                                "stillness": self.user_data[user_id]['mean_angular_stillness'] + \
-                                             self.user_data[user_id]['mean_stillness'],
-                                "distance": self.user_data[user_id]['mean_distance']
+                                "stillness": angular_stillness + stillness,
+                                "distance": mean_distance
                                 }
+        thresholds = self.thresholds
         # looking away from soldier (not their head) >33
-        if percentage_looking_at_face < 0.66:
-            adjusted_attentiveness = {"stillness": attentiveness_value["stillness"] + 2 * self.STILLNESS_MEAN_STD, "distance": attentiveness_value["distance"]}
-            for key, value in adjusted_attentiveness.iteritems():
-                attentiveness_value[key] = 1.0 / value
-        elif self.user_data[user_id]['mean_distance'] > 1.5 * self.DISTANCE_MEAN_STD:  # looking at the HEAD of the soldier, but standing very far away (can be commented out if distance is not to be included in nervousness calculation)
-            adjusted_attentiveness = {"stillness": attentiveness_value["stillness"] + self.STILLNESS_MEAN_STD, "distance": attentiveness_value["distance"] + 2 * self.DISTANCE_MEAN_STD}
-            for key, value in adjusted_attentiveness.iteritems():
-                attentiveness_value[key] = 1.0 / value
+        if percentage_looking_at_face < thresholds["looking_at_face"]:
+            if self.probe is not None:
+                self.probe.branch("nervous_toward_combatant.looking_away")
+            adjusted_attentiveness = {"stillness": attentiveness_values["stillness"] + thresholds["away_stillness"] * self.STILLNESS_MEAN_STD, "distance": attentiveness_values["distance"]}
+            for key, value in adjusted_attentiveness.items():
+                attentiveness_values[key] = 1.0 / value
+        elif mean_distance > thresholds["far_distance"] * self.DISTANCE_MEAN_STD:  # looking at the HEAD of the soldier, but standing very far away (can be commented out if distance is not to be included in nervousness calculation)
+            if self.probe is not None:
+                self.probe.branch("nervous_toward_combatant.standing_far")
+            adjusted_attentiveness = {"stillness": attentiveness_values["stillness"] + thresholds["far_stillness"] * self.STILLNESS_MEAN_STD, "distance": attentiveness_values["distance"] + thresholds["far_distance_offset"] * self.DISTANCE_MEAN_STD}
+            for key, value in adjusted_attentiveness.items():
+                attentiveness_values[key] = 1.0 / value
+        elif self.probe is not None:
+            self.probe.branch("nervous_toward_combatant.looking_at_face")
         return attentiveness_values
 
+    def load_web_registration(self, path):
+        """Loads the web registration survey export (.csv or .json) used by the
+           web_reg scoring variants and epilogue_intro
+            Args:
+                path(str): path of the export
+        """
+        if path.endswith(".csv"):
+            self.web_registration = Web_Registration_Table.from_csv(path)
+        else:
+            self.web_registration = Web_Registration_Table.from_json(path)
+        self.scores.clear()
+
+    def web_registration_bias(self, combatant_name, user_id):
+        """Answer of the web registration bias test (Questions 2-4) for a combatant
+            Args:
+                combatant_name(str): name of a combatant
+                user_id(int): id of the user of interest
+            Return:
+                boolean representing if the user reported a bias towards the combatant
+        """
+        return self.web_registration.bias(combatant_name, user_id)
+
     def nervous_toward_combatant_web_reg(self, combatant_name, user_id):
         """Calculates a score representing the attention paid towards a given combatant which is taken
         to represent a users nervousness; please note that this function takes into account the user web
@@ -97,7 +1395,7 @@ class Bias_Nervousness_Model():
 
         Note:
             The Questions 2-4 from the updated online user registration questions in the spec should be
-            used for this "test" on evaluating if user.web_registration_bias_data(combatant_name) is True or False.
+            used for this "test" on evaluating if web_registration_bias(combatant_name, user_id) is True or False.
 
         Args:
             combatant_name(str): name of the combatant calculating nervouseness
@@ -110,24 +1408,34 @@ class Bias_Nervousness_Model():
         # self.LOWER_BOUND = bounds["lower_bound"]
         # self.UPPER_BOUND = bounds["upper_bound"]
         # float
-        percentage_looking_at_face = self.percentage_looking_at_face(combatant_name)
+        percentage_looking_at_face = self.percentage_looking_at_face(combatant_name, user_id)
         # float
-        attentiveness_value = self.user_data[user_id]['mean_angular_stillness'] + \
-                              self.user_data[user_id]['mean_stillness'] + \
-                              self.user_data[user_id]['mean_distance']
+        mean_distance, stillness, angular_stillness = self.cohort.row(user_id)
+        attentiveness_value = angular_stillness + stillness + mean_distance
         # looking away from soldier (not their head) >33
-        if percentage_looking_at_face < 0.66:
+        thresholds = self.thresholds
+        if percentage_looking_at_face < thresholds["looking_at_face"]:
             if attentiveness_value < self.LOWER_BOUND:
-                if user.web_registration_bias_data(combatant_name):
-                        return attentiveness_value + 2*self.MEAN_STD
+                if self.web_registration_bias(combatant_name, user_id):
+                        if self.probe is not None:
+                            self.probe.branch("nervous_toward_combatant_web_reg.below_lower_biased")
+                        return attentiveness_value + (thresholds["web_reg_below"] + thresholds["web_reg_biased"]) * self.MEAN_STD
                 else:
-                        return attentiveness_value + self.MEAN_STD
+                        if self.probe is not None:
+                            self.probe.branch("nervous_toward_combatant_web_reg.below_lower")
+                        return attentiveness_value + thresholds["web_reg_below"] * self.MEAN_STD
             else:
-                if user.web_registration_bias_data(combatant_name):
-                         return attentiveness_value + 3 * self.MEAN_STD
+                if self.web_registration_bias(combatant_name, user_id):
+                         if self.probe is not None:
+                             self.probe.branch("nervous_toward_combatant_web_reg.above_lower_biased")
+                         return attentiveness_value + (thresholds["web_reg_above"] + thresholds["web_reg_biased"]) * self.MEAN_STD
                 else:
-                        return attentiveness_value + 2*self.MEAN_STD
+                        if self.probe is not None:
+                            self.probe.branch("nervous_toward_combatant_web_reg.above_lower")
+                        return attentiveness_value + thresholds["web_reg_above"] * self.MEAN_STD
         else:  # looking at the HEAD of the solider
+            if self.probe is not None:
+                self.probe.branch("nervous_toward_combatant_web_reg.looking_at_face")
             return attentiveness_value
 
     def nervous_toward_combatant_score(self, combatant_name, user_id):
@@ -145,16 +1453,23 @@ class Bias_Nervousness_Model():
         # bounds = calculate_bounds(self.user_data[user_id])
         # self.LOWER_BOUND = bounds["lower_bound"]
         # self.UPPER_BOUND = bounds["upper_bound"]
+        key = (user_id, combatant_name, "plain")
+        score = self.scores.get(key)
+        if score is not None:
+            return score
         adjusted_value = self.nervous_toward_combatant(combatant_name, user_id)
         if adjusted_value["distance"] < self.DISTANCE_LOWER_BOUND:
-            return -1
+            score = -1
         elif adjusted_value["stillness"] < self.STILLNESS_LOWER_BOUND:
-            return -1
+            score = -1
         elif adjusted_value["distance"] > self.DISTANCE_UPPER_BOUND:
-            return 1
+            score = 1
         elif adjusted_value["stillness"] > self.STILLNESS_UPPER_BOUND:
-            return 1
-        return 0
+            score = 1
+        else:
+            score = 0
+        self.scores.put(key, score)
+        return score
 
     def nervous_toward_combatant_score_web_reg(self, combatant_name, user_id):
         """Calculates a value representing the attention paid towards a given
@@ -170,12 +1485,131 @@ class Bias_Nervousness_Model():
         # bounds = calculate_bounds(self.user_data[user_id])
         # self.LOWER_BOUND = bounds["lower_bound"]
         # self.UPPER_BOUND = bounds["upper_bound"]
-        adjusted_value = self.nervous_toward_combatant(combatant_name, user_id)
+        key = (user_id, combatant_name, "web_reg")
+        score = self.scores.get(key)
+        if score is not None:
+            return score
+        adjusted_value = self.nervous_toward_combatant_web_reg(combatant_name, user_id)
         if adjusted_value < self.LOWER_BOUND:
-            return -1
+            score = -1
         elif adjusted_value < self.UPPER_BOUND:
-            return 0
-        return 1
+            score = 0
+        else:
+            score = 1
+        self.scores.put(key, score)
+        return score
+
+    def looking_matrix(self, user_ids, combatant_names):
+        """Collects percentage_looking_at_face for every user/combatant pair
+            Args:
+                user_ids(sequence): ids of the users of interest
+                combatant_names(sequence): names of the combatants of interest
+            Return:
+                looking(numpy.ndarray): (users, combatants) percentages
+        """
+        return self.gaze.percentages(user_ids, combatant_names)
+
+    def web_registration_bias_matrix(self, user_ids, combatant_names):
+        """Collects web_registration_bias for every user/combatant pair
+            Args:
+                user_ids(sequence): ids of the users of interest
+                combatant_names(sequence): names of the combatants of interest
+            Return:
+                web_bias(numpy.ndarray): (users, combatants) booleans
+        """
+        return self.web_registration.bias_matrix(user_ids, combatant_names)
+
+    def score_matrix(self, user_ids, combatant_names, web_reg=False, looking=None, web_bias=None):
+        """Scores every user against every combatant in one vectorized pass; applies
+           the same thresholds as nervous_toward_combatant_score (or the _web_reg
+           variant) and gives identical results
+            Args:
+                user_ids(sequence): ids of the users of interest
+                combatant_names(sequence): names of the combatants of interest
+                web_reg(bool): use the web registration variant of the scoring
+                looking(numpy.ndarray): optional precomputed (users, combatants)
+                                        percentage_looking_at_face values
+                web_bias(numpy.ndarray): optional precomputed (users, combatants)
+                                         web registration bias answers
+            Return:
+                scores(dict): "score" holds the -1/0/1 (users, combatants) matrix;
+                              plus the adjusted "stillness" and "distance" matrices,
+                              or the adjusted "value" matrix when web_reg is set
+        """
+        values = self.cohort.values[self.cohort.rows(user_ids)]
+        if looking is None:
+            looking = self.looking_matrix(user_ids, combatant_names)
+        if web_reg and web_bias is None:
+            web_bias = self.web_registration_bias_matrix(user_ids, combatant_names)
+        return score_attentiveness(values, looking, self.thresholds, self.bounds,
+                                   web_bias if web_reg else None)
+
+    def sweep(self, grid, conflicts, user_ids=None, web_reg=False, block_size=1 << 22):
+        """Scores the cohort under every combination of a grid of thresholds; the
+           aggregates, gaze and web registration lookups are gathered once and a
+           block of settings is scored per vectorized pass
+            Args:
+                grid(dict): {threshold name: candidate values} over the keys of
+                            VARIANT_THRESHOLDS the chosen variant reads; unswept
+                            thresholds keep this model's values
+                conflicts(list): conflicts to report the bias outcomes of
+                user_ids(sequence): ids of the users of interest (default: the whole cohort)
+                web_reg(bool): use the web registration variant of the scoring
+                block_size(int): scores computed per pass, bounding the memory used
+            Return:
+                results(list): per setting, in grid order, {"thresholds": {...},
+                               "scores": {"-1": n, "0": n, "1": n},
+                               "conflicts": {name: {"B": n, "1": n, "N": n}}}
+        """
+        unknown = set(grid) - set(THRESHOLDS)
+        if unknown:
+            raise ValueError("unknown thresholds: %s" % ", ".join(sorted(unknown)))
+        variant = "web_reg" if web_reg else "plain"
+        unused = set(grid) - VARIANT_THRESHOLDS[variant]
+        if unused:
+            raise ValueError("the %s scoring does not read %s, so sweeping it cannot change "
+                             "the scores" % (variant, ", ".join(sorted(unused))))
+        if user_ids is None:
+            user_ids = list(self.cohort.index)
+        combatant_names = list(dict.fromkeys(name for conflict in conflicts
+                                             for name in (conflict["combatant_1"], conflict["combatant_2"])))
+        columns = {name: column for column, name in enumerate(combatant_names)}
+        values = self.cohort.values[self.cohort.rows(user_ids)]
+        looking = self.looking_matrix(user_ids, combatant_names)
+        web_bias = self.web_registration_bias_matrix(user_ids, combatant_names) if web_reg else None
+
+        names = list(grid)
+        settings = list(itertools.product(*(grid[name] for name in names)))
+        # None for a bound means the cohort's own, as in the model
+        defaults = {"lower_bound": self.bounds["lower_bound"], "upper_bound": self.bounds["upper_bound"]}
+        candidates = numpy.array([[defaults.get(name) if value is None else value
+                                   for name, value in zip(names, setting)]
+                                  for setting in settings], dtype=float).reshape(len(settings), len(names))
+        step = max(1, block_size // max(1, looking.size))
+        results = []
+        for first in range(0, len(settings), step):
+            block = candidates[first:first + step]
+            thresholds = dict(self.thresholds)
+            for position, name in enumerate(names):
+                thresholds[name] = block[:, position].reshape(-1, 1, 1)
+            score = score_attentiveness(values, looking, thresholds, self.bounds, web_bias)["score"]
+            score = numpy.broadcast_to(score, (len(block),) + looking.shape)
+            counts = [(score == value).sum(axis=(1, 2)) for value in (-1, 0, 1)]
+            outcomes = {}
+            for conflict in conflicts:
+                biased_1 = score[:, :, columns[conflict["combatant_1"]]] != 0
+                biased_2 = score[:, :, columns[conflict["combatant_2"]]] != 0
+                both = (biased_1 & biased_2).sum(axis=1)
+                one = (biased_1 ^ biased_2).sum(axis=1)
+                outcomes[conflict["name"]] = (both, one, len(user_ids) - both - one)
+            for offset, setting in enumerate(settings[first:first + step]):
+                results.append({"thresholds": dict(zip(names, setting)),
+                                "scores": {"-1": int(counts[0][offset]), "0": int(counts[1][offset]),
+                                           "1": int(counts[2][offset])},
+                                "conflicts": {name: {"B": int(both[offset]), "1": int(one[offset]),
+                                                     "N": int(neither[offset])}
+                                              for name, (both, one, neither) in outcomes.items()}})
+        return results
 
     def biased_toward_combatant(self, combatant_name, user_id):
         """Determines if a user has a bias towards a given combatant
@@ -186,7 +1620,7 @@ class Bias_Nervousness_Model():
                 boolean representing if a user is or is not neutral towards
                 a given combatant
         """
-        if self.nervous_toward_combatant(combatant_name, user_id) == 0:
+        if self.nervous_toward_combatant_score(combatant_name, user_id) == 0:
             return False
         return True
 
@@ -199,130 +1633,104 @@ class Bias_Nervousness_Model():
                 boolean representing if a user is or is not neutral towards
                 a given combatant
         """
-        if self.nervous_toward_combatant_web_reg(combatant_name, user_id) == 0:
+        if self.nervous_toward_combatant_score_web_reg(combatant_name, user_id) == 0:
             return False
         return True
 
     def biased_toward_either(self, conflict, user_id):
         """Determines if a user has a bias towards either combatant in a conflict
             Args:
-                conflict(str): name of a given conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 boolean representing if a user is or is not neutral towards
                 either combatant
         """
-        return self.biased_toward_combatant(conflict["combatant_1"]) and \
-               self.biased_toward_combatant(conflict["combatant_2"])
+        return self.biased_toward_combatant(conflict["combatant_1"], user_id) and \
+               self.biased_toward_combatant(conflict["combatant_2"], user_id)
 
-     def biased_toward_either_web_reg(self, conflict, user_id):
+    def biased_toward_either_web_reg(self, conflict, user_id):
         """Determines if a user has a bias towards either combatant in a conflict; please note that this function uses the web registration data while the other biased_toward_either function does not.
             Args:
-                conflict(str): name of a given conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 boolean representing if a user is or is not neutral towards
                 either combatant
         """
-        return self.biased_toward_combatant_web_reg(conflict["combatant_1"]) and \
-               self.biased_toward_combatant_web_reg(conflict["combatant_2"])
+        return self.biased_toward_combatant_web_reg(conflict["combatant_1"], user_id) and \
+               self.biased_toward_combatant_web_reg(conflict["combatant_2"], user_id)
 
 
     def biased_toward_which(self, conflict, user_id):
         """Determines which combatant a user has a bias towards (if any)
-        """Also updates the User_Bias_Per_Conflict array based on their bias towards Both ("B"), Neither ("N"), or one combatant (1)
+        Also updates the user's state trajectory in the session table based on their bias towards Both ("B"), Neither ("N"), or one combatant (1)
             Args:
-                conflict(str): name of a given conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 string representing the name of the combatant a user has a
                 bias towards, neither, or both
-        ""
-        if self.biased_toward_combatant(conflict["combatant_1"]) == -1:
-            if self.biased_toward_combatant(conflict["combatant_2"] == -1):
-                user.Bias_Per_Conflict[conflict] = "B"
-                return "both"
-            else:
-                user.Bias_Per_Conflict[conflict] = "1"
-                return conflict["combatant_1"]
-        elif self.biased_toward_combatant(conflict["combatant_2"]):
-            return conflict["combatant_2"]
-        user.Bias_Per_Conflict[conflict] = "N"
+        """
+        conflict_index = self.conflict_index(conflict)
+        biased_1 = self.biased_toward_combatant(conflict["combatant_1"], user_id)
+        biased_2 = self.biased_toward_combatant(conflict["combatant_2"], user_id)
+        if biased_1 and biased_2:
+            self.cohort.set_trajectory(user_id, conflict_index, "B")
+            return "both"
+        elif biased_1 or biased_2:
+            self.cohort.set_trajectory(user_id, conflict_index, "1")
+            return conflict["combatant_1"] if biased_1 else conflict["combatant_2"]
+        self.cohort.set_trajectory(user_id, conflict_index, "N")
         return "neither"
 
     def biased_toward_which_web_reg(self, conflict, user_id):
         """Determines which combatant a user has a bias towards (if any); please note that this function uses the web_reg version of the biased_toward_combatant function.
-        """Also updates the User_Bias_Per_Conflict array based on their bias towards Both ("B"), Neither ("N"), or one combatant (1)
+        Also updates the user's state trajectory in the session table based on their bias towards Both ("B"), Neither ("N"), or one combatant (1)
             Args:
-                conflict(str): name of a given conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 string representing the name of the combatant a user has a
                 bias towards, neither, or both
-        ""
-        if self.biased_toward_combatant_web_reg(conflict["combatant_1"]) == -1:
-            if self.biased_toward_combatant_web_reg(conflict["combatant_2"] == -1):
-                user.Bias_Per_Conflict[conflict] = "B"
-                return "both"
-            else:
-                user.Bias_Per_Conflict[conflict] = "1"
-                return conflict["combatant_1"]
-        elif self.biased_toward_combatant_web_reg(conflict["combatant_2"]):
-            return conflict["combatant_2"]
-        user.Bias_Per_Conflict[conflict] = "N"
+        """
+        conflict_index = self.conflict_index(conflict)
+        biased_1 = self.biased_toward_combatant_web_reg(conflict["combatant_1"], user_id)
+        biased_2 = self.biased_toward_combatant_web_reg(conflict["combatant_2"], user_id)
+        if biased_1 and biased_2:
+            self.cohort.set_trajectory(user_id, conflict_index, "B")
+            return "both"
+        elif biased_1 or biased_2:
+            self.cohort.set_trajectory(user_id, conflict_index, "1")
+            return conflict["combatant_1"] if biased_1 else conflict["combatant_2"]
+        self.cohort.set_trajectory(user_id, conflict_index, "N")
         return "neither"
 
     def negative_bias_toward_either(self, conflict, user_id):
         """Determines if a user has a negative bias towards either combatant in
            a conflict
             Args:
-                conflict(str): name of a given conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 boolean representing if a user has a negative bias towards either
                 combatant in a conflict
         """
-        return self.biased_toward_combatant(conflict["combatant_1"]) == -1 or \
-               self.biased_toward_combatant(conflict["combatant_2"] == -1)
+        return self.nervous_toward_combatant_score(conflict["combatant_1"], user_id) == -1 or \
+               self.nervous_toward_combatant_score(conflict["combatant_2"], user_id) == -1
 
     def negative_bias_toward_either_web_reg(self, conflict, user_id):
         """Determines if a user has a negative bias towards either combatant in a conflict; please note that this function uses the web registration data while the other negative_bias_toward_either function does not.
  
             Args:
-                conflict(str): name of a given conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 boolean representing if a user has a negative bias towards either
                 combatant in a conflict
         """
-        return self.biased_toward_combatant_web_reg(conflict["combatant_1"]) == -1 or \
-               self.biased_toward_combatant_web_reg(conflict["combatant_2"] == -1)
-
-    def sky_change_test(self, combatant_name, user_id):
-        """Calculates the values set for cloud/brightness states such
-        that for continuous nervousness the sky goes from fully sunny
-        to fully cloudy over the course of an interaction with an individual
-        combatant (roughly 7.5 minutes)
-            Args:
-                combatant_name(str): name of a combatant
-                user_id(int): id of the user of interest
-            Return:
-                sky_environment(float): continuous value between 0 and 1,
-                                        where 0 to .5 indicates opacity of the
-                                        altostratus cloud layer over the sunny
-                                        layer and .5 to 1 indicates the opacity
-                                        of the nimbostratus layer over altostratus
-                                        layer
-        """
-        prev_state = self.prev_states.get("user_id", 0)
-        new_state = self.biased_toward_combatant(combatant_name, user_id)
-        tmp = prev_state
-        self.prev_states["user_id"] = new_state
-        if new_state < prev_state:
-            return tmp + 1./15
-        elif new_state > prev_state:
-            return max(0, tmp - 1./15)
-        return new_state
+        return self.nervous_toward_combatant_score_web_reg(conflict["combatant_1"], user_id) == -1 or \
+               self.nervous_toward_combatant_score_web_reg(conflict["combatant_2"], user_id) == -1
 
     def epilogue_intro(self,user_id):
         """Determines whether or not the user is a “hawk” 
@@ -345,25 +1753,29 @@ class Bias_Nervousness_Model():
         case_id = 4:  User is somewhat anti-war
         case_id = 5:  User is most anti-war
         """
+        table = self.web_registration
+        row = table.users.get(user_id)
         # declares the variable to be 0 by default
-            case_id = 0
+        case_id = 0
         # checks whether or not the user has completed the web registration survey 
-           if user.web_registration_data_completed = True:
-        # for users who completed the web survey: we evaluate the choice they made for question 1
-        # key: linear scale: 1=most pro-war to 5=most anti-war
-              if user.web_registration_data(question_1) = “1”: 
-                    case_id = 1
-              elif user.web_registration_data(question_1) = “2”: 
-                    case_id = 2
-              elif user.web_registration_data(question_1) = “3”: 
-                    case_id = 3
-              elif user.web_registration_data(question_1) = “4”: 
-                    case_id = 4
-              elif user.web_registration_data(question_1) = “5”: 
-                    case_id = 5
+        if row is not None and table.completed[row]:
+            # for users who completed the web survey: the case is the choice they made for question 1
+            # key: linear scale: 1=most pro-war to 5=most anti-war
+            answer = int(table.answers[row, 0])
+            if 1 <= answer <= 5:
+                case_id = answer
         return case_id
 
-    def user_state_trajectory(self, user_data):
+    def epilogue_cases(self, user_ids):
+        """Vectorized epilogue_intro over a cohort
+            Args:
+                user_ids(sequence): ids of the users of interest
+            Return:
+                case_ids(numpy.ndarray): case id 0-5 per user
+        """
+        return self.web_registration.epilogue_cases(user_ids)
+
+    def user_state_trajectory(self, user_id):
         """Returns an array tracking the user's nervousness for each combatant across the 3 conflicts. each element of
         the array corresponds to the nervousness that the user had towards the combatants for the given conflict --
         e.g.: first element corresponds to the first conflict. this can be used at the end to determine the user's final
@@ -374,13 +1786,18 @@ class Bias_Nervousness_Model():
             “B” = User was nervous towards BOTH combatants in this conflict.
             “N” = User was nervous towards NEITHER combatant in this conflict.
             “1” = User was nervous towards ONE combatant in this conflict.
+
+        Args:
+            user_id(int): id of the user of interest
+        Return:
+            trajectory(list): states recorded by biased_toward_which, in conflict order
         """
-        return user.Bias_Per_Conflict
+        return self.cohort.trajectory(user_id)
 
     def post_epilogue_transformation_mirror(self, conflict, user_id):
         """Indicates which combatant the user's avatar looks like at the end
             Args:
-                conflict(str): name of a conflict
+                conflict(dict): a given conflict: {"name": ..., "combatant_1": ..., "combatant_2": ...}
                 user_id(int): id of the user of interest
             Return:
                 combatant_name(str): name of the combatant the user's avatar
@@ -389,9 +1806,9 @@ class Bias_Nervousness_Model():
                                      are identical aribitrarily returns the second
                                      combatant
         """
-        (combatant_1, combatant_2) = conflict.combatants
-        combatant_1_bias = nervous_toward_combatant_score(combatant_1, user_id)
-        combatant_2_bias = nervous_toward_combatant_score(combatant_2, user_id)
+        (combatant_1, combatant_2) = (conflict["combatant_1"], conflict["combatant_2"])
+        combatant_1_bias = self.nervous_toward_combatant_score(combatant_1, user_id)
+        combatant_2_bias = self.nervous_toward_combatant_score(combatant_2, user_id)
         if combatant_1_bias > combatant_2_bias:
             return combatant_1
         return combatant_2
@@ -412,12 +1829,802 @@ class Bias_Nervousness_Model():
                                         of the nimbostratus layer over altostratus
                                         layer
         """
-        prev_state = self.prev_states.get("user_id", 0)
-        new_state = self.nervous_toward_combatant(combatant_name, user_id)
-        tmp = prev_state
-        self.prev_states["user_id"] = new_state
-        if new_state < prev_state:
-            return tmp + 1./15
-        elif new_state > prev_state:
-            return max(0, tmp - 1./15)
-        return new_state
+        return self.sky.tick(user_id, combatant_name)
+
+
+class Session_Aggregate():
+    """Fixed-size running aggregates of one user's headset frames
+    """
+    __slots__ = ("frames", "elapsed", "distance_sum", "path_length", "angle_sum",
+                 "last_time", "last_position", "last_rotation")
+
+    def __init__(self):
+        self.frames = 0
+        self.elapsed = 0.0
+        self.distance_sum = 0.0
+        self.path_length = 0.0
+        self.angle_sum = 0.0
+        self.last_time = None
+        self.last_position = None
+        self.last_rotation = None
+
+    def add(self, timestamp, position, rotation, gaze_target):
+        """Folds one frame into the aggregates
+            Args:
+                timestamp(float): frame time in seconds
+                position(sequence): head position (x, y, z) in meters
+                rotation(sequence): head rotation as a unit quaternion (w, x, y, z)
+                gaze_target(sequence): point (x, y, z) the gaze ray hits
+        """
+        px, py, pz = position
+        gx, gy, gz = gaze_target
+        self.distance_sum += math.sqrt((gx - px) ** 2 + (gy - py) ** 2 + (gz - pz) ** 2)
+        if self.last_time is not None:
+            lx, ly, lz = self.last_position
+            self.path_length += math.sqrt((px - lx) ** 2 + (py - ly) ** 2 + (pz - lz) ** 2)
+            dot = abs(sum(a * b for a, b in zip(rotation, self.last_rotation)))
+            self.angle_sum += 2.0 * math.acos(min(1.0, dot))
+            self.elapsed += timestamp - self.last_time
+        self.frames += 1
+        self.last_time = timestamp
+        self.last_position = (px, py, pz)
+        self.last_rotation = tuple(rotation)
+
+    def values(self):
+        """Return:
+               values(tuple): mean distance to the gaze target, stillness (mean head
+                              speed in m/s) and angular stillness (mean angular speed
+                              in rad/s), in Cohort_Store column order
+        """
+        mean_distance = self.distance_sum / self.frames if self.frames else 0.0
+        if self.elapsed <= 0:
+            return (mean_distance, 0.0, 0.0)
+        return (mean_distance, self.path_length / self.elapsed, self.angle_sum / self.elapsed)
+
+
+class Gaze_Buffer():
+    """Fixed-size block of a user's gaze rays waiting to be hit-tested
+    """
+    __slots__ = ("scene", "origins", "directions", "count")
+
+    def __init__(self, size):
+        self.scene = None
+        self.origins = numpy.empty((size, 3))
+        self.directions = numpy.empty((size, 3))
+        self.count = 0
+
+
+class Telemetry_Archive():
+    """Recorded headset telemetry in a compact binary file read through numpy.memmap:
+       a fixed header, every user's frames back to back and a per-user offset index
+       sorted by user_id; nothing is loaded until a session or aggregate is asked for,
+       so archives larger than memory can be aggregated block by block
+    """
+    MAGIC = b"ENEMYTLM"
+    VERSION = 1
+    HEADER = numpy.dtype([("magic", "S8"), ("version", "<u4"), ("reserved", "<u4"),
+                          ("users", "<u8"), ("frames", "<u8"), ("index_offset", "<u8")])
+    INDEX = numpy.dtype([("user_id", "<i8"), ("start", "<u8"), ("count", "<u8")])
+    FRAME = numpy.dtype([("timestamp", "<f8"),
+                         ("position", "<f4", (3,)),
+                         ("rotation", "<f4", (4,)),
+                         ("gaze_target", "<f4", (3,))])
+
+    def __init__(self, path):
+        """
+            Args:
+                path(str): file written by Telemetry_Archive.write
+        """
+        self.path = path
+        header = numpy.fromfile(path, dtype=self.HEADER, count=1)
+        if len(header) != 1 or header["magic"][0] != self.MAGIC:
+            raise ValueError("%s is not a telemetry archive" % path)
+        if header["version"][0] != self.VERSION:
+            raise ValueError("unsupported telemetry archive version %d" % header["version"][0])
+        (users, frames, index_offset) = (int(header["users"][0]), int(header["frames"][0]),
+                                         int(header["index_offset"][0]))
+        self.frames = numpy.memmap(path, dtype=self.FRAME, mode="r",
+                                   offset=self.HEADER.itemsize, shape=(frames,)) \
+            if frames else numpy.empty(0, dtype=self.FRAME)
+        self.index = numpy.memmap(path, dtype=self.INDEX, mode="r",
+                                  offset=index_offset, shape=(users,)) \
+            if users else numpy.empty(0, dtype=self.INDEX)
+
+    @classmethod
+    def write(cls, path, sessions):
+        """Streams sessions into a new archive; only one session is in memory at a time
+            Args:
+                path(str): file to create
+                sessions(iterable): (user_id, frames) pairs, frames being a FRAME array
+                                    or a dict of "timestamp" (n,), "position" (n, 3),
+                                    "rotation" (n, 4) and "gaze_target" (n, 3) arrays
+            Return:
+                archive(Telemetry_Archive)
+        """
+        entries = []
+        start = 0
+        with open(path, "wb") as handle:
+            handle.write(numpy.zeros(1, dtype=cls.HEADER).tobytes())
+            for user_id, frames in sessions:
+                if not isinstance(frames, numpy.ndarray):
+                    block = numpy.empty(len(frames["timestamp"]), dtype=cls.FRAME)
+                    for name in cls.FRAME.names:
+                        block[name] = frames[name]
+                    frames = block
+                frames = numpy.ascontiguousarray(frames, dtype=cls.FRAME)
+                handle.write(frames.tobytes())
+                entries.append((user_id, start, len(frames)))
+                start += len(frames)
+            index = numpy.array(entries, dtype=cls.INDEX)
+            index.sort(order="user_id")
+            if len(index) > 1 and (index["user_id"][1:] == index["user_id"][:-1]).any():
+                raise ValueError("a user_id appears more than once")
+            index_offset = handle.tell()
+            handle.write(index.tobytes())
+            header = numpy.array([(cls.MAGIC, cls.VERSION, 0, len(index), start, index_offset)],
+                                 dtype=cls.HEADER)
+            handle.seek(0)
+            handle.write(header.tobytes())
+        return cls(path)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, user_id):
+        return self._entry(user_id) is not None
+
+    @property
+    def user_ids(self):
+        return self.index["user_id"]
+
+    def _entry(self, user_id):
+        position = numpy.searchsorted(self.index["user_id"], user_id)
+        if position < len(self.index) and self.index["user_id"][position] == user_id:
+            return self.index[position]
+        return None
+
+    def session(self, user_id):
+        """Looks up a user's frames without copying them
+            Args:
+                user_id(int): id of the user of interest
+            Return:
+                frames(numpy.ndarray): FRAME view into the memory map
+        """
+        entry = self._entry(user_id)
+        if entry is None:
+            raise KeyError(user_id)
+        start = int(entry["start"])
+        return self.frames[start:start + int(entry["count"])]
+
+    @staticmethod
+    def aggregate(frames, starts, counts):
+        """Vectorized Session_Aggregate over consecutive sessions of one block of frames
+            Args:
+                frames(numpy.ndarray): FRAME rows of the sessions, back to back
+                starts(numpy.ndarray): first row of each session within frames
+                counts(numpy.ndarray): frame count of each session
+            Return:
+                values(numpy.ndarray): (sessions, 3) mean distance, stillness and
+                                       angular stillness, as Session_Aggregate.values
+        """
+        values = numpy.zeros((len(starts), 3))
+        if not len(frames):
+            return values
+        timestamp = frames["timestamp"]
+        position = frames["position"].astype(numpy.float64)
+        rotation = frames["rotation"].astype(numpy.float64)
+        distance = numpy.sqrt(((frames["gaze_target"] - position) ** 2).sum(axis=1))
+        # per-frame deltas from the previous frame; the first frame of a session has none
+        step = numpy.zeros(len(frames))
+        step[1:] = numpy.sqrt(((position[1:] - position[:-1]) ** 2).sum(axis=1))
+        angle = numpy.zeros(len(frames))
+        dot = numpy.abs((rotation[1:] * rotation[:-1]).sum(axis=1))
+        angle[1:] = 2.0 * numpy.arccos(numpy.minimum(1.0, dot))
+        present = counts > 0
+        (starts, counts) = (starts[present], counts[present])
+        step[starts] = 0.0
+        angle[starts] = 0.0
+        ends = starts + counts - 1
+        elapsed = timestamp[ends] - timestamp[starts]
+        moving = elapsed > 0
+        rows = numpy.flatnonzero(present)
+        values[rows, 0] = numpy.add.reduceat(distance, starts) / counts
+        values[rows[moving], 1] = numpy.add.reduceat(step, starts)[moving] / elapsed[moving]
+        values[rows[moving], 2] = numpy.add.reduceat(angle, starts)[moving] / elapsed[moving]
+        return values
+
+    def aggregates(self, block_frames=1 << 22):
+        """Per-user aggregates of the whole archive, reading at most about block_frames
+           frames at a time (a single longer session is read on its own)
+            Args:
+                block_frames(int): frames per block
+            Return:
+                (user_ids, values): index user ids and their (n, 3) aggregates
+        """
+        index = self.index
+        order = numpy.argsort(index["start"], kind="stable")
+        starts = index["start"][order].astype(numpy.int64)
+        counts = index["count"][order].astype(numpy.int64)
+        # empty sessions share their start with the next session, so a block ends at its furthest end
+        ends = numpy.maximum.accumulate(starts + counts)
+        values = numpy.empty((len(index), 3))
+        first = 0
+        while first < len(order):
+            # take every session starting within block_frames of this block's first frame
+            last = max(first + 1, int(numpy.searchsorted(starts, starts[first] + block_frames)))
+            begin, end = starts[first], ends[last - 1]
+            values[order[first:last]] = self.aggregate(numpy.asarray(self.frames[begin:end]),
+                                                       starts[first:last] - begin,
+                                                       counts[first:last])
+            first = last
+        return index["user_id"], values
+
+    def cohort(self, block_frames=1 << 22):
+        """Return:
+               cohort(Cohort_Store): session table of every archived user, ready for
+                                     Bias_Nervousness_Model
+        """
+        user_ids, values = self.aggregates(block_frames)
+        return Cohort_Store.from_arrays(user_ids.tolist(), values[:, 0], values[:, 1], values[:, 2])
+
+
+class Snapshot_File():
+    """Versioned binary snapshot of a fitted model: a fixed header, the model's tables
+       as raw arrays and a JSON footer with the remaining state and the position of
+       every array; arrays are memory-mapped copy-on-write, so loading reads only the
+       header and footer whatever the size of the tables
+    """
+    MAGIC = b"ENEMYSNP"
+    VERSION = 1
+    HEADER = numpy.dtype([("magic", "S8"), ("version", "<u4"), ("reserved", "<u4"),
+                          ("state_offset", "<u8"), ("state_length", "<u8")])
+    ALIGNMENT = 64
+
+    def __init__(self, path):
+        """
+            Args:
+                path(str): file written by Snapshot_File.write
+        """
+        self.path = path
+        header = numpy.fromfile(path, dtype=self.HEADER, count=1)
+        if len(header) != 1 or header["magic"][0] != self.MAGIC:
+            raise ValueError("%s is not a model snapshot" % path)
+        if header["version"][0] != self.VERSION:
+            raise ValueError("unsupported model snapshot version %d" % header["version"][0])
+        with open(path, "rb") as handle:
+            handle.seek(int(header["state_offset"][0]))
+            footer = json.loads(handle.read(int(header["state_length"][0])).decode("utf-8"))
+        self.state = footer["state"]
+        self.layout = footer["arrays"]
+
+    @classmethod
+    def write(cls, path, state, arrays):
+        """
+            Args:
+                path(str): file to create
+                state(dict): JSON-serializable state
+                arrays(dict): {name: numpy.ndarray}
+        """
+        layout = {}
+        with open(path, "wb") as handle:
+            handle.write(numpy.zeros(1, dtype=cls.HEADER).tobytes())
+            for name, array in arrays.items():
+                array = numpy.ascontiguousarray(array)
+                handle.write(b"\0" * (-handle.tell() % cls.ALIGNMENT))
+                layout[name] = {"offset": handle.tell(), "shape": list(array.shape),
+                                "dtype": array.dtype.descr if array.dtype.names else array.dtype.str}
+                handle.write(array.tobytes())
+            footer = json.dumps({"state": state, "arrays": layout}).encode("utf-8")
+            state_offset = handle.tell()
+            handle.write(footer)
+            header = numpy.array([(cls.MAGIC, cls.VERSION, 0, state_offset, len(footer))],
+                                 dtype=cls.HEADER)
+            handle.seek(0)
+            handle.write(header.tobytes())
+
+    def array(self, name):
+        """Return:
+               array(numpy.ndarray): copy-on-write memory map of a stored array
+        """
+        entry = self.layout[name]
+        dtype = entry["dtype"]
+        if not isinstance(dtype, str):
+            # JSON turns the structured descr's tuples into lists
+            dtype = [tuple(field[:2]) + tuple(tuple(extra) for extra in field[2:]) for field in dtype]
+        dtype = numpy.dtype(dtype)
+        shape = tuple(entry["shape"])
+        if dtype.itemsize == 0 or 0 in shape:
+            return numpy.zeros(shape, dtype=dtype)
+        return numpy.memmap(self.path, dtype=dtype, mode="c", offset=entry["offset"], shape=shape)
+
+    @staticmethod
+    def id_array(index):
+        """Packs the keys of a {user_id: row} dict into an array ordered by row
+        """
+        user_ids = [None] * len(index)
+        for user_id, row in index.items():
+            user_ids[row] = user_id
+        if all(isinstance(user_id, int) for user_id in user_ids):
+            return numpy.array(user_ids, dtype=numpy.int64)
+        if all(isinstance(user_id, str) for user_id in user_ids):
+            return numpy.array(user_ids, dtype=str)
+        raise ValueError("user ids must be all integers or all strings to be saved")
+
+    @staticmethod
+    def id_index(user_ids):
+        """Unpacks an array written by id_array back into a {user_id: row} dict
+        """
+        return dict(zip(user_ids.tolist(), range(len(user_ids))))
+
+
+class Sensor_Stream():
+    """Ingests per-frame headset samples and keeps each user's live aggregates in the
+       model's cohort, so the scoring methods see the session as it happens; memory
+       per user is constant regardless of frame rate or session length
+    """
+
+    def __init__(self, model, publish_every=90):
+        """
+            Args:
+                model(Bias_Nervousness_Model): model whose cohort receives the aggregates
+                publish_every(int): frames between pushes of a user's aggregates into
+                                    the cohort (90 is about once a second on a headset)
+        """
+        self.model = model
+        self.publish_every = publish_every
+        self.sessions = {}
+        self.gaze_buffers = {}
+
+    def ingest_frame(self, user_id, timestamp, position, rotation, gaze_target, scene=None):
+        """Adds one frame for a user (see Session_Aggregate.add for the arguments); when
+           the scene is given the gaze ray is also hit-tested against the combatants'
+           heads registered for it in model.gaze
+        """
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = self.sessions[user_id] = Session_Aggregate()
+        session.add(timestamp, position, rotation, gaze_target)
+        if scene is not None:
+            buffer = self.gaze_buffers.get(user_id)
+            if buffer is None:
+                buffer = self.gaze_buffers[user_id] = Gaze_Buffer(self.publish_every)
+            if buffer.scene != scene or buffer.count == len(buffer.origins):
+                self.flush_gaze(user_id)
+                buffer.scene = scene
+            buffer.origins[buffer.count] = position
+            buffer.directions[buffer.count] = [target - origin for target, origin in zip(gaze_target, position)]
+            buffer.count += 1
+        if session.frames % self.publish_every == 0:
+            self.publish(user_id)
+
+    def ingest(self, user_id, frames, scene=None):
+        """Consumes a generator of (timestamp, position, rotation, gaze_target) frames
+            Args:
+                user_id(int): id of the user wearing the headset
+                frames(iterable): frames in time order
+                scene(str): scene the frames belong to, for looking-at-face tracking
+            Return:
+                count(int): number of frames consumed
+        """
+        count = 0
+        for timestamp, position, rotation, gaze_target in frames:
+            self.ingest_frame(user_id, timestamp, position, rotation, gaze_target, scene)
+            count += 1
+        if count:
+            self.publish(user_id)
+        return count
+
+    async def ingest_async(self, user_id, frames, scene=None):
+        """Same as ingest but consumes an async iterator of frames
+        """
+        count = 0
+        async for timestamp, position, rotation, gaze_target in frames:
+            self.ingest_frame(user_id, timestamp, position, rotation, gaze_target, scene)
+            count += 1
+        if count:
+            self.publish(user_id)
+        return count
+
+    def flush_gaze(self, user_id):
+        """Hit-tests a user's buffered gaze rays and adds them to model.gaze
+            Args:
+                user_id(int): id of the user of interest
+        """
+        buffer = self.gaze_buffers.get(user_id)
+        if buffer is None or buffer.count == 0:
+            return
+        self.model.record_gaze(user_id, buffer.scene, buffer.origins[:buffer.count],
+                                buffer.directions[:buffer.count])
+        buffer.count = 0
+
+    def publish(self, user_id):
+        """Pushes a user's live aggregates into the model's cohort and its pending
+           gaze rays into the looking-at-face counts
+            Args:
+                user_id(int): id of the user of interest
+        """
+        self.flush_gaze(user_id)
+        self.model.update_session(user_id, self.sessions[user_id].values())
+
+    def finish(self, user_id):
+        """Ends a user's session: the final aggregates update the model's bounds and
+           the per-user state is released
+            Args:
+                user_id(int): id of the user whose session ended
+            Return:
+                values(tuple): the session's mean distance, stillness and angular stillness
+        """
+        self.flush_gaze(user_id)
+        self.gaze_buffers.pop(user_id, None)
+        values = self.sessions.pop(user_id).values()
+        self.model.end_session(user_id, *values)
+        return values
+
+
+class Scoring_Service():
+    """Hosts one shared model for every headset station of the installation; stations
+       send newline-delimited JSON requests over a local socket:
+           {"id": 1, "op": "score", "user_id": 7, "combatant": "...", "web_reg": false}
+           {"id": 2, "op": "sky", "user_id": 7, "combatant": "..."}
+           {"id": 3, "op": "epilogue", "user_id": 7}
+           {"id": 4, "op": "end_session", "user_id": 7, "values": [distance, stillness, angular]}
+           {"id": 5, "op": "recompute_bounds"}
+           {"id": 6, "op": "metrics"}
+       and get back {"id": ..., "result": ...} or {"id": ..., "error": "..."}.
+       Model calls only run on the event loop thread, so per-user state is never
+       touched concurrently; bounds come from the model's running moments, which
+       update in constant time, so nothing has to be recomputed off the loop
+    """
+
+    def __init__(self, model):
+        """
+            Args:
+                model(Bias_Nervousness_Model): the shared model
+        """
+        self.model = model
+        self.handlers = {"score": self.score,
+                         "sky": self.sky,
+                         "epilogue": self.epilogue,
+                         "end_session": self.end_session,
+                         "recompute_bounds": self.recompute_bounds,
+                         "metrics": self.metrics}
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """Starts listening on localhost (or a unix socket when path is given)
+            Return:
+                server(asyncio.Server)
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+        """Serves one station connection until it closes
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be a JSON object")
+                except ValueError as error:
+                    # malformed lines get an error reply instead of dropping the station
+                    response = {"id": None, "error": "%s: %s" % (type(error).__name__, error)}
+                else:
+                    response = await self.dispatch(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        """Runs one request
+            Args:
+                request(dict): decoded request
+            Return:
+                response(dict)
+        """
+        response = {"id": request.get("id")}
+        try:
+            response["result"] = self.handlers[request["op"]](request)
+        except Exception as error:
+            response["error"] = "%s: %s" % (type(error).__name__, error)
+        return response
+
+    def score(self, request):
+        if request.get("web_reg"):
+            return self.model.nervous_toward_combatant_score_web_reg(request["combatant"], request["user_id"])
+        return self.model.nervous_toward_combatant_score(request["combatant"], request["user_id"])
+
+    def sky(self, request):
+        return self.model.sky_change_test(request["combatant"], request["user_id"])
+
+    def epilogue(self, request):
+        return self.model.epilogue_intro(request["user_id"])
+
+    def metrics(self, request):
+        return self.model.probe.snapshot() if self.model.probe is not None else None
+
+    def end_session(self, request):
+        self.model.end_session(request["user_id"], *request["values"])
+        return None
+
+    def recompute_bounds(self, request):
+        return self.model.refresh_bounds()
+
+
+def load_user_data(path):
+    """Reads a JSON list (or {user_id: {...}} mapping) of per-user aggregates
+    """
+    with open(path) as handle:
+        user_data = json.load(handle)
+    if isinstance(user_data, dict):
+        return {int(user_id) if user_id.isdigit() else user_id: user
+                for user_id, user in user_data.items()}
+    return user_data
+
+
+def user_records(user_data):
+    """Turns loaded user data into a list of records that all carry a "user_id"
+        Args:
+            user_data(list or dict): as returned by load_user_data; a list record
+                                     without a "user_id" is identified by its position
+        Return:
+            records(list)
+    """
+    if isinstance(user_data, dict):
+        return [dict(record, user_id=user_id) for user_id, record in user_data.items()]
+    for position, record in enumerate(user_data):
+        record.setdefault("user_id", position)
+    return user_data
+
+
+def load_looking_at_face(model, records):
+    """Loads archived gaze shares ("looking_at_face": {combatant_name: share} in each
+       record carrying a "user_id") into the model's gaze index
+    """
+    for record in records:
+        for combatant_name, percentage in record.get("looking_at_face", {}).items():
+            model.set_looking_at_face(combatant_name, record["user_id"], percentage)
+
+
+# per-process settings of a reanalysis worker, set once by _start_reanalysis_worker
+_reanalysis = {}
+
+
+def _start_reanalysis_worker(settings):
+    _reanalysis.update(settings)
+
+
+def reanalyze_shard(records):
+    """Re-scores one shard of the visitor archive inside a worker process
+        Args:
+            records(list): archived users; each carries "user_id", the cohort keys
+                           and optionally "looking_at_face": {combatant_name: share}
+        Return:
+            lines(str): one JSON line per user with its trajectory, epilogue case
+                        and mirror combatant per conflict
+    """
+    settings = _reanalysis
+    # the global bounds come from the parent, so the shard never recomputes them
+    model = Bias_Nervousness_Model(records, thresholds=settings["thresholds"],
+                                   bounds=settings["bounds"])
+    model.web_registration = settings["web_registration"]
+    load_looking_at_face(model, records)
+    if settings["web_reg"]:
+        which = model.biased_toward_which_web_reg
+    else:
+        which = model.biased_toward_which
+    lines = []
+    for record in records:
+        user_id = record["user_id"]
+        mirror = {}
+        for conflict in settings["conflicts"]:
+            which(conflict, user_id)
+            mirror[conflict["name"]] = model.post_epilogue_transformation_mirror(conflict, user_id)
+        lines.append(json.dumps({"user_id": user_id,
+                                 "trajectory": model.user_state_trajectory(user_id),
+                                 "epilogue_case": model.epilogue_intro(user_id),
+                                 "mirror": mirror}))
+    return "".join(line + "\n" for line in lines)
+
+
+def reanalyze(records, conflicts, output_path, thresholds=None, web_registration=None,
+              web_reg=False, workers=None, shard_size=2000):
+    """Re-scores a whole visitor archive across a process pool
+        Args:
+            records(list): archived users (see reanalyze_shard); a missing "user_id"
+                           defaults to the record's position in the archive
+            conflicts(list): conflicts in narrative order
+            output_path(str): JSON lines file written in archive order
+            thresholds(dict): overrides of the module THRESHOLDS
+            web_registration(Web_Registration_Table): survey answers, if any
+            web_reg(bool): score with the web registration variants
+            workers(int): worker processes (defaults to the number of cores)
+            shard_size(int): users per shard handed to a worker
+        Return:
+            bounds(dict): the global bounds every shard was scored against
+    """
+    for position, record in enumerate(records):
+        record.setdefault("user_id", position)
+    # the bounds are global to the archive: compute them once here and ship them to each worker
+    means, variances = column_moments(Cohort_Store(records).values)
+    bounds = bounds_from_moments(means, numpy.sqrt(variances))
+    settings = {"bounds": bounds, "thresholds": thresholds, "conflicts": conflicts,
+                "web_registration": web_registration or Web_Registration_Table(),
+                "web_reg": web_reg}
+    shards = [records[start:start + shard_size] for start in range(0, len(records), shard_size)]
+    with multiprocessing.Pool(workers, initializer=_start_reanalysis_worker,
+                              initargs=(settings,)) as pool, open(output_path, "w") as output:
+        for lines in pool.imap(reanalyze_shard, shards):
+            output.write(lines)
+    return bounds
+
+
+def parse_thresholds(pairs):
+    """Parses repeated name=value command line overrides of THRESHOLDS
+    """
+    thresholds = {}
+    for pair in pairs or ():
+        name, _, value = pair.partition("=")
+        if name not in THRESHOLDS or not value:
+            raise ValueError("expected one of %s as name=value, got %r"
+                             % (", ".join(THRESHOLDS), pair))
+        thresholds[name] = float(value)
+    return thresholds
+
+
+def parse_grid(pairs):
+    """Parses repeated name=value,value,... command line threshold grids; "none"
+       stands for the cohort's own bound
+    """
+    grid = {}
+    for pair in pairs:
+        name, _, values = pair.partition("=")
+        if name not in THRESHOLDS or not values:
+            raise ValueError("expected one of %s as name=value,value,..., got %r"
+                             % (", ".join(THRESHOLDS), pair))
+        candidates = [None if value.lower() == "none" else float(value) for value in values.split(",")]
+        if None in candidates and name not in ("lower_bound", "upper_bound"):
+            raise ValueError("only lower_bound and upper_bound accept none, got %r" % pair)
+        grid[name] = candidates
+    return grid
+
+
+def run_sweep(args):
+    with open(args.conflicts) as handle:
+        conflicts = json.load(handle)
+    model = load_model(args)
+    if args.web_registration:
+        model.load_web_registration(args.web_registration)
+    started = time.perf_counter()
+    results = model.sweep(parse_grid(args.grid), conflicts, web_reg=args.web_reg)
+    elapsed = time.perf_counter() - started
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=1)
+        print("swept %d settings over %d users in %.2fs" % (len(results), len(model.cohort), elapsed))
+    else:
+        print(json.dumps(results, indent=1))
+
+
+def run_reanalysis(args):
+    with open(args.conflicts) as handle:
+        conflicts = json.load(handle)
+    web_registration = None
+    if args.web_registration:
+        if args.web_registration.endswith(".csv"):
+            web_registration = Web_Registration_Table.from_csv(args.web_registration)
+        else:
+            web_registration = Web_Registration_Table.from_json(args.web_registration)
+    records = load_user_data(args.archive)
+    if isinstance(records, dict):
+        records = [dict(record, user_id=user_id) for user_id, record in records.items()]
+    started = time.perf_counter()
+    bounds = reanalyze(records, conflicts, args.output, thresholds=parse_thresholds(args.threshold),
+                       web_registration=web_registration, web_reg=args.web_reg,
+                       workers=args.workers, shard_size=args.shard_size)
+    print("reanalyzed %d users in %.2fs (lower bound %.3f, upper bound %.3f)"
+          % (len(records), time.perf_counter() - started,
+             bounds["lower_bound"], bounds["upper_bound"]))
+
+
+def load_model(args):
+    """Builds the model from --snapshot, or fits it to --user-data (JSON, with any
+       archived looking_at_face shares, or .tlm); --max-resident and --archive-path,
+       where the command has them, override the ones saved in a snapshot
+    """
+    residency = {name: getattr(args, name) for name in ("max_resident", "archive_path")
+                 if getattr(args, name, None) is not None}
+    if getattr(args, "snapshot", None):
+        model = Bias_Nervousness_Model.load_snapshot(args.snapshot)
+        for name, value in residency.items():
+            setattr(model, name, value)
+        return model
+    if args.user_data.endswith(".tlm"):
+        return Bias_Nervousness_Model(Telemetry_Archive(args.user_data).cohort(), **residency)
+    records = user_records(load_user_data(args.user_data))
+    model = Bias_Nervousness_Model(records, **residency)
+    load_looking_at_face(model, records)
+    return model
+
+
+def save_snapshot(args):
+    started = time.perf_counter()
+    model = load_model(args)
+    if args.web_registration:
+        model.load_web_registration(args.web_registration)
+    model.save_snapshot(args.output)
+    print("saved %d users in %.2fs" % (len(model.cohort), time.perf_counter() - started))
+
+
+def serve(args):
+    async def run():
+        model = load_model(args)
+        if args.web_registration:
+            model.load_web_registration(args.web_registration)
+        if args.metrics_port:
+            model.instrument().serve_prometheus(args.metrics_port)
+        service = Scoring_Service(model)
+        server = await service.start(args.host, args.port, args.socket)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nervousness and bias model for The Enemy")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="serve the model to headset stations")
+    serve_source = serve_parser.add_mutually_exclusive_group(required=True)
+    serve_source.add_argument("--user-data", help="JSON file of per-user aggregates, or a .tlm telemetry archive")
+    serve_source.add_argument("--snapshot", help="model snapshot written by the snapshot command")
+    serve_parser.add_argument("--web-registration", help="web registration survey export (.csv or .json)")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--socket", help="unix socket path instead of host/port")
+    serve_parser.add_argument("--metrics-port", type=int,
+                              help="instrument the model and serve Prometheus metrics on localhost")
+    serve_parser.add_argument("--max-resident", type=int,
+                              help="archive finished sessions once the session table holds more users")
+    serve_parser.add_argument("--archive-path", help="JSON lines file archived sessions are appended to")
+    serve_parser.set_defaults(run=serve)
+    snapshot_parser = subparsers.add_parser("snapshot", help="fit the model and save it for fast boot")
+    snapshot_parser.add_argument("--user-data", required=True,
+                                 help="JSON file of per-user aggregates, or a .tlm telemetry archive")
+    snapshot_parser.add_argument("--web-registration", help="web registration survey export (.csv or .json)")
+    snapshot_parser.add_argument("--output", required=True, help="snapshot file to write")
+    snapshot_parser.set_defaults(run=save_snapshot)
+    reanalyze_parser = subparsers.add_parser("reanalyze",
+                                             help="re-score the visitor archive across worker processes")
+    reanalyze_parser.add_argument("--archive", required=True, help="JSON file of archived users")
+    reanalyze_parser.add_argument("--conflicts", required=True, help="JSON list of conflicts in order")
+    reanalyze_parser.add_argument("--output", required=True, help="JSON lines file of results")
+    reanalyze_parser.add_argument("--web-registration", help="web registration survey export (.csv or .json)")
+    reanalyze_parser.add_argument("--web-reg", action="store_true",
+                                  help="score with the web registration variants")
+    reanalyze_parser.add_argument("--threshold", action="append", metavar="NAME=VALUE",
+                                  help="override one of the THRESHOLDS (repeatable)")
+    reanalyze_parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    reanalyze_parser.add_argument("--shard-size", type=int, default=2000, help="users per shard")
+    reanalyze_parser.set_defaults(run=run_reanalysis)
+    sweep_parser = subparsers.add_parser("sweep", help="score the cohort under a grid of thresholds")
+    sweep_parser.add_argument("--user-data", required=True,
+                              help="JSON file of per-user aggregates, or a .tlm telemetry archive")
+    sweep_parser.add_argument("--conflicts", required=True, help="JSON list of conflicts in order")
+    sweep_parser.add_argument("--grid", action="append", required=True, metavar="NAME=VALUE,...",
+                              help="candidate values of one of the THRESHOLDS (repeatable)")
+    sweep_parser.add_argument("--web-registration", help="web registration survey export (.csv or .json)")
+    sweep_parser.add_argument("--web-reg", action="store_true",
+                              help="score with the web registration variants")
+    sweep_parser.add_argument("--output", help="JSON file of results (default: stdout)")
+    sweep_parser.set_defaults(run=run_sweep)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
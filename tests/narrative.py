@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+
+def load_narrative():
+    """Imports enemy-narr.py (the hyphen keeps it from being imported by name)
+    """
+    if "enemy_narr" in sys.modules:
+        return sys.modules["enemy_narr"]
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "enemy-narr.py")
+    spec = importlib.util.spec_from_file_location("enemy_narr", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+narr = load_narrative()
@@ -0,0 +1,89 @@
+import numpy
+import pytest
+
+from narrative import narr
+
+
+def weighted_moments(values, weights):
+    mean = (weights[:, None] * values).sum(axis=0) / weights.sum()
+    variance = (weights[:, None] * (values - mean) ** 2).sum(axis=0) / weights.sum()
+    return mean, variance
+
+
+def assert_moments(stats, values, weights):
+    mean, variance = weighted_moments(values, weights)
+    assert stats.weight == pytest.approx(weights.sum())
+    numpy.testing.assert_allclose(stats.mean, mean)
+    numpy.testing.assert_allclose(stats.variance(), variance)
+
+
+@pytest.mark.parametrize("decay", [None, 0.97])
+def test_updates_match_direct_recompute(decay):
+    rng = numpy.random.default_rng(0)
+    seeded = rng.normal(2.0, 0.5, (200, 3))
+    added = rng.normal(2.5, 0.3, (50, 3))
+    stats = narr.Running_Stats.from_values(seeded, decay=decay)
+    for values in added:
+        stats.update(values)
+    # the seeded rows age as one batch, each added session from when it was added
+    factor = 1.0 if decay is None else decay
+    weights = numpy.concatenate([numpy.full(len(seeded), factor ** len(added)),
+                                 factor ** numpy.arange(len(added) - 1, -1, -1)])
+    assert_moments(stats, numpy.vstack([seeded, added]), weights)
+
+
+@pytest.mark.parametrize("decay", [None, 0.97])
+def test_remove_takes_back_a_session(decay):
+    rng = numpy.random.default_rng(1)
+    seeded = rng.normal(2.0, 0.5, (100, 3))
+    added = rng.normal(2.5, 0.3, (20, 3))
+    stats = narr.Running_Stats.from_values(seeded, decay=decay)
+    for values in added:
+        stats.update(values)
+    stats.remove(seeded[3], since=0)
+    stats.remove(added[5], since=6)
+    factor = 1.0 if decay is None else decay
+    weights = numpy.concatenate([numpy.full(len(seeded), factor ** len(added)),
+                                 factor ** numpy.arange(len(added) - 1, -1, -1)])
+    weights[[3, len(seeded) + 5]] = 0.0
+    assert_moments(stats, numpy.vstack([seeded, added]), weights)
+
+
+def test_remove_the_last_session_empties_the_moments():
+    stats = narr.Running_Stats()
+    stats.update((1.0, 2.0, 3.0))
+    stats.remove((1.0, 2.0, 3.0), since=1)
+    assert stats.weight == 0
+    numpy.testing.assert_array_equal(stats.variance(), numpy.zeros(3))
+
+
+def test_merge_matches_the_combined_cohort():
+    rng = numpy.random.default_rng(2)
+    site_1 = rng.normal(2.0, 0.5, (150, 3))
+    site_2 = rng.normal(3.0, 0.8, (70, 3))
+    stats = narr.Running_Stats.from_values(site_1)
+    stats.merge(narr.Running_Stats.from_values(site_2))
+    stats.merge(narr.Running_Stats())
+    assert_moments(stats, numpy.vstack([site_1, site_2]), numpy.ones(220))
+    empty = narr.Running_Stats()
+    empty.merge(narr.Running_Stats.from_values(site_2))
+    assert_moments(empty, site_2, numpy.ones(70))
+
+
+@pytest.mark.parametrize("decay", [None, 0.99])
+def test_repeat_sessions_keep_the_moments_in_step_with_the_table(decay):
+    rng = numpy.random.default_rng(3)
+    users = [{"mean_distance": a, "stillness": b, "angular_stillness": c}
+             for a, b, c in rng.normal(2.0, 0.5, (300, 3))]
+    model = narr.Bias_Nervousness_Model(users, decay=decay)
+    for session in range(1500):
+        user_id = int(rng.integers(0, 400))
+        if session % 3 == 0:
+            model.update_session(user_id, rng.normal(1.0, 0.5, 3))
+        model.end_session(user_id, *rng.normal(2.0, 0.5, 3))
+    records = model.cohort.records
+    counted = records["stats_update"] >= 0
+    factor = 1.0 if decay is None else decay
+    weights = numpy.where(counted, factor ** (model.stats.updates - records["stats_update"]), 0.0)
+    assert_moments(model.stats, records["values"], weights)
+    assert model.bounds == model.stats.bounds()
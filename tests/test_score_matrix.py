@@ -0,0 +1,155 @@
+import numpy
+import pytest
+
+from narrative import narr
+
+
+COMBATANTS = ["combatant_%d" % column for column in range(4)]
+
+
+def random_model(seed, users=600, thresholds=None):
+    """Cohort mixing every branch of the scoring: looking away, standing far away
+       while looking at the face, zero distance and users without gaze data
+    """
+    rng = numpy.random.default_rng(seed)
+    values = rng.normal(2.0, 0.6, (users, 3)).clip(0.05)
+    values[rng.random(users) < 0.2, 0] *= 4.0
+    values[rng.random(users) < 0.05, 0] = 0.0
+    model = narr.Bias_Nervousness_Model(narr.Cohort_Store.from_arrays(range(users), *values.T),
+                                        thresholds=thresholds)
+    for user_id in range(users):
+        for combatant_name in COMBATANTS:
+            if rng.random() < 0.9:
+                model.set_looking_at_face(combatant_name, user_id, rng.random())
+    model.web_registration = narr.Web_Registration_Table.from_records(
+        [{"user_id": user_id, "completed": True,
+          "bias": {name: bool(rng.random() < 0.5) for name in COMBATANTS}}
+         for user_id in range(0, users, 2)])
+    return model
+
+
+# the scalar path divides numpy scalars, which warns (and gives inf) at zero distance
+@pytest.mark.filterwarnings("ignore:divide by zero")
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("web_reg", [False, True])
+@pytest.mark.parametrize("thresholds", [None, {"looking_at_face": 0.5, "far_distance": 1.0,
+                                               "web_reg_biased": 0.5, "upper_bound": 7.0}])
+def test_score_matrix_matches_scalar_path(seed, web_reg, thresholds):
+    model = random_model(seed, thresholds=thresholds)
+    user_ids = list(model.cohort.index)
+    score = model.nervous_toward_combatant_score_web_reg if web_reg else model.nervous_toward_combatant_score
+    expected = numpy.array([[score(name, user_id) for name in COMBATANTS] for user_id in user_ids])
+    matrix = model.score_matrix(user_ids, COMBATANTS, web_reg=web_reg)["score"]
+    numpy.testing.assert_array_equal(matrix, expected)
+
+
+def test_random_cohort_covers_every_branch():
+    model = random_model(0)
+    user_ids = list(model.cohort.index)
+    looking = model.looking_matrix(user_ids, COMBATANTS)
+    distance = model.cohort.values[:, 0:1]
+    looking_away = looking < model.thresholds["looking_at_face"]
+    standing_far = ~looking_away & (distance > model.thresholds["far_distance"] * model.DISTANCE_MEAN_STD)
+    assert looking_away.any() and standing_far.any() and (~looking_away & ~standing_far).any()
+    assert (looking_away & (distance == 0)).any()
+    scores = model.score_matrix(user_ids, COMBATANTS)["score"]
+    assert set(numpy.unique(scores)) == {-1, 0, 1}
+
+
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_sky_engine_matches_scalar_path():
+    model = random_model(3)
+    user_ids = list(model.cohort.index)
+    for user_id in user_ids:
+        for name in COMBATANTS:
+            assert model.sky.nervous(name, user_id) == (model.nervous_toward_combatant_score(name, user_id) != 0)
+
+
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_sky_engine_zero_variance_cohort_with_live_session():
+    model = narr.Bias_Nervousness_Model([{"mean_distance": 2.0, "stillness": 0.0, "angular_stillness": 0.0}] * 5)
+    # the first frame of a live session has no stillness yet
+    model.update_session(7, (0.0, 0.0, 0.0))
+    model.update_session(8, (3.0, 0.0, 0.0))
+    model.set_looking_at_face("combatant_0", 7, 0.1)
+    for user_id in (7, 8, 0):
+        assert model.sky.nervous("combatant_0", user_id) == \
+            (model.nervous_toward_combatant_score("combatant_0", user_id) != 0)
+
+
+@pytest.mark.parametrize("web_reg", [False, True])
+def test_sweep_matches_score_matrix(web_reg):
+    model = random_model(4, users=200)
+    conflicts = [{"name": "conflict_0", "combatant_1": COMBATANTS[0], "combatant_2": COMBATANTS[1]},
+                 {"name": "conflict_1", "combatant_1": COMBATANTS[2], "combatant_2": COMBATANTS[3]}]
+    if web_reg:
+        grid = {"looking_at_face": [0.5, 0.66], "web_reg_biased": [0.0, 1.0], "lower_bound": [None, 5.0]}
+    else:
+        grid = {"looking_at_face": [0.5, 0.66], "far_distance": [1.0, 1.5]}
+    user_ids = list(model.cohort.index)
+    for result in model.sweep(grid, conflicts, web_reg=web_reg):
+        setting = narr.Bias_Nervousness_Model(model.cohort, thresholds=result["thresholds"], bounds=model.bounds)
+        setting.gaze = model.gaze
+        setting.web_registration = model.web_registration
+        scores = setting.score_matrix(user_ids, COMBATANTS, web_reg=web_reg)["score"]
+        assert result["scores"] == {str(value): int((scores == value).sum()) for value in (-1, 0, 1)}
+        for position, conflict in enumerate(conflicts):
+            biased = scores[:, 2 * position:2 * position + 2] != 0
+            assert result["conflicts"][conflict["name"]]["B"] == int(biased.all(axis=1).sum())
+            assert result["conflicts"][conflict["name"]]["1"] == int((biased.sum(axis=1) == 1).sum())
+
+
+def test_sweep_rejects_bound_grids_without_web_reg():
+    model = random_model(5, users=20)
+    for name in ("lower_bound", "upper_bound", "web_reg_below", "web_reg_above", "web_reg_biased"):
+        with pytest.raises(ValueError, match=name):
+            model.sweep({"looking_at_face": [0.66], name: [None, 4.097]}, [])
+    for name in ("far_distance", "away_stillness", "far_stillness", "far_distance_offset"):
+        with pytest.raises(ValueError, match=name):
+            model.sweep({"looking_at_face": [0.66], name: [1.0, 2.0]}, [], web_reg=True)
+    assert len(model.sweep({"looking_at_face": [0.5, 0.66], "far_distance": [1.0]}, [])) == 2
+    assert len(model.sweep({"looking_at_face": [0.5, 0.66], "upper_bound": [None]}, [], web_reg=True)) == 2
+    with pytest.raises(ValueError):
+        narr.parse_grid(["looking_at_face=none"])
+    assert narr.parse_grid(["upper_bound=none,4.629"]) == {"upper_bound": [None, 4.629]}
+
+
+def test_sky_is_sunny_before_the_first_publish():
+    model = random_model(6, users=20)
+    stream = narr.Sensor_Stream(model)
+    stream.ingest_frame(1000, 0.0, (0.0, 1.7, 0.0), (1.0, 0.0, 0.0, 0.0), (0.0, 1.7, 2.0))
+    assert 1000 not in model.cohort
+    assert model.sky_change_test(COMBATANTS[0], 1000) == 0.0
+    assert model.sky.tick(1000, COMBATANTS[0], now=60.0) == 0.0
+
+
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_gaze_writes_drop_cached_scores():
+    model = random_model(7, users=50)
+    user_ids = list(model.cohort.index)
+
+    def cached_scores():
+        return numpy.array([[model.nervous_toward_combatant_score(name, user_id) for name in COMBATANTS[:1]]
+                            for user_id in user_ids])
+
+    for user_id in user_ids:
+        model.set_looking_at_face(COMBATANTS[0], user_id, 0.1)
+    looking_away = cached_scores()
+    for user_id in user_ids:
+        model.set_looking_at_face(COMBATANTS[0], user_id, 0.9)
+    looking_at_face = cached_scores()
+    assert (looking_at_face != looking_away).any()
+    numpy.testing.assert_array_equal(looking_at_face, model.score_matrix(user_ids, COMBATANTS[:1])["score"])
+
+    # a scene change flushes the buffered rays (all at the combatant's face) without a publish
+    for user_id in user_ids:
+        model.set_looking_at_face(COMBATANTS[0], user_id, 0.1)
+    numpy.testing.assert_array_equal(cached_scores(), looking_away)
+    model.gaze.add_scene("arena", {COMBATANTS[0]: ((0.0, 1.7, 2.0), 0.2)})
+    model.gaze.add_scene("hall", {})
+    stream = narr.Sensor_Stream(model)
+    for user_id in user_ids:
+        for frame in range(20):
+            stream.ingest_frame(user_id, frame / 60.0, (0.0, 1.7, 0.0), (1.0, 0.0, 0.0, 0.0), (0.0, 1.7, 2.0), "arena")
+        stream.ingest_frame(user_id, 1.0, (0.0, 1.7, 0.0), (1.0, 0.0, 0.0, 0.0), (0.0, 1.7, 2.0), "hall")
+    numpy.testing.assert_array_equal(cached_scores(), looking_at_face)
@@ -0,0 +1,33 @@
+import asyncio
+import json
+
+from narrative import narr
+
+
+def exchange(lines):
+    """Sends raw request lines to a local Scoring_Service over one connection
+    """
+    async def run():
+        model = narr.Bias_Nervousness_Model([{"mean_distance": 2.0, "stillness": 1.0, "angular_stillness": 0.5},
+                                             {"mean_distance": 3.0, "stillness": 0.5, "angular_stillness": 1.0}])
+        server = await narr.Scoring_Service(model).start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = []
+            for line in lines:
+                writer.write(line + b"\n")
+                await writer.drain()
+                responses.append(json.loads(await reader.readline()))
+            writer.close()
+        return responses
+    return asyncio.run(run())
+
+
+def test_malformed_lines_get_an_error_and_keep_the_connection():
+    responses = exchange([b"{not json", b"[1, 2]", b'{"id": 3, "op": "epilogue", "user_id": 0}',
+                          b'{"id": 4, "op": "nope"}'])
+    assert responses[0]["id"] is None and responses[0]["error"].startswith("JSONDecodeError")
+    assert responses[1]["id"] is None and "error" in responses[1]
+    assert responses[2] == {"id": 3, "result": 0}
+    assert responses[3]["id"] == 4 and responses[3]["error"].startswith("KeyError")
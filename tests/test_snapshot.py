@@ -0,0 +1,82 @@
+import argparse
+import json
+
+import numpy
+import pytest
+
+from narrative import narr
+from test_score_matrix import COMBATANTS, random_model
+
+
+CONFLICTS = [{"name": "conflict_%d" % position, "combatant_1": COMBATANTS[position],
+              "combatant_2": COMBATANTS[position + 1]} for position in range(3)]
+
+
+def played_model(seed):
+    """Random cohort part way through the exhibit: conflicts decided, skies stepped
+       and sessions ended after the cohort was fitted
+    """
+    model = random_model(seed, users=300)
+    user_ids = list(model.cohort.index)
+    for position, conflict in enumerate(CONFLICTS):
+        for user_id in user_ids[position * 50:]:
+            model.biased_toward_which(conflict, user_id)
+    model.sky.step_seconds = 0.0
+    for now in range(3):
+        for user_id in user_ids[:100]:
+            model.sky.tick(user_id, COMBATANTS[now], float(now))
+    for user_id in (1000, 1001, 5):
+        model.end_session(user_id, 1.5, 0.1, 0.3)
+    return model
+
+
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_snapshot_round_trip(tmp_path):
+    model = played_model(8)
+    path = str(tmp_path / "model.snp")
+    model.save_snapshot(path)
+    loaded = narr.Bias_Nervousness_Model.load_snapshot(path)
+    user_ids = list(model.cohort.index)
+    assert list(loaded.cohort.index) == user_ids
+    assert loaded.bounds == model.bounds
+    for web_reg in (False, True):
+        numpy.testing.assert_array_equal(loaded.score_matrix(user_ids, COMBATANTS, web_reg=web_reg)["score"],
+                                         model.score_matrix(user_ids, COMBATANTS, web_reg=web_reg)["score"])
+    assert [loaded.user_state_trajectory(user_id) for user_id in user_ids] == \
+        [model.user_state_trajectory(user_id) for user_id in user_ids]
+    numpy.testing.assert_array_equal(loaded.epilogue_cases(user_ids), model.epilogue_cases(user_ids))
+    numpy.testing.assert_array_equal(loaded.cohort.records["sky_level"], model.cohort.records["sky_level"])
+    assert (model.cohort.records["sky_level"] > 0).any()
+    # the first tick after a restart shows the saved sky without stepping it
+    assert [loaded.sky_change_test(COMBATANTS[0], user_id) for user_id in user_ids] == \
+        [model.sky.OPACITY[model.cohort.sky_level[model.cohort.index[user_id]]] for user_id in user_ids]
+
+
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_snapshot_restarts_sky_timers(tmp_path):
+    model = played_model(9)
+    path = str(tmp_path / "model.snp")
+    model.save_snapshot(path)
+    assert not numpy.isnan(model.cohort.records["sky_last_step"]).all()
+    loaded = narr.Bias_Nervousness_Model.load_snapshot(path)
+    assert numpy.isnan(loaded.cohort.records["sky_last_step"]).all()
+    # the first tick after a restart only starts the timer, whatever the clock reads
+    level = loaded.cohort.sky_level[loaded.cohort.index[0]]
+    loaded.sky.step_seconds = 30.0
+    assert loaded.sky.tick(0, COMBATANTS[0], now=0.5) == loaded.sky.OPACITY[level]
+    assert loaded.cohort.sky_last_step[loaded.cohort.index[0]] == 0.5
+
+
+def test_load_model_keeps_archived_looking_at_face(tmp_path):
+    users = {str(user_id): {"mean_distance": 2.0 + user_id % 3, "stillness": 1.0, "angular_stillness": 0.5,
+                            "looking_at_face": {COMBATANTS[0]: 0.1 * user_id}}
+             for user_id in range(8)}
+    user_data = tmp_path / "visitors.json"
+    user_data.write_text(json.dumps(users))
+    expected = numpy.array([[0.1 * user_id] for user_id in range(8)])
+    model = narr.load_model(argparse.Namespace(user_data=str(user_data)))
+    numpy.testing.assert_allclose(model.looking_matrix(list(range(8)), COMBATANTS[:1]), expected)
+    snapshot = str(tmp_path / "model.snp")
+    narr.save_snapshot(argparse.Namespace(user_data=str(user_data), web_registration=None, output=snapshot))
+    model = narr.load_model(argparse.Namespace(snapshot=snapshot))
+    numpy.testing.assert_allclose(model.looking_matrix(list(range(8)), COMBATANTS[:1]), expected)
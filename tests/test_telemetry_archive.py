@@ -0,0 +1,60 @@
+import numpy
+import pytest
+
+from narrative import narr
+
+
+def random_sessions(users, seed):
+    """Sessions of random length with the headset wandering around; every tenth user
+       has no frames at all and every tenth but one a single frame
+    """
+    rng = numpy.random.default_rng(seed)
+    for user_id in range(users):
+        frames = 0 if user_id % 10 == 0 else 1 if user_id % 10 == 1 else int(rng.integers(2, 120))
+        rotation = rng.normal(size=(frames, 4))
+        rotation /= numpy.linalg.norm(rotation, axis=1)[:, None]
+        # user ids out of order, so the index is sorted differently from the frames
+        yield (users - user_id) * 3, {"timestamp": numpy.cumsum(rng.uniform(0.005, 0.02, frames)),
+                                      "position": rng.normal(size=(frames, 3)),
+                                      "rotation": rotation,
+                                      "gaze_target": rng.normal(size=(frames, 3))}
+
+
+def frame_by_frame(archive, user_id):
+    session = narr.Session_Aggregate()
+    for frame in archive.session(user_id):
+        session.add(float(frame["timestamp"]), frame["position"].astype(float).tolist(),
+                    frame["rotation"].astype(float).tolist(), frame["gaze_target"].astype(float).tolist())
+    return session.values()
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    return narr.Telemetry_Archive.write(str(tmp_path_factory.mktemp("telemetry") / "visitors.tlm"),
+                                        random_sessions(200, seed=0))
+
+
+# blocks of a single frame, shorter than most sessions, a few sessions, and the whole archive
+@pytest.mark.parametrize("block_frames", [1, 7, 500, 1 << 22])
+def test_aggregates_match_session_aggregate(archive, block_frames):
+    user_ids, values = archive.aggregates(block_frames=block_frames)
+    assert sorted(user_ids.tolist()) == sorted(archive.index["user_id"].tolist())
+    expected = numpy.array([frame_by_frame(archive, user_id) for user_id in user_ids.tolist()])
+    numpy.testing.assert_allclose(values, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_empty_sessions_are_kept(archive):
+    user_ids, values = archive.aggregates(block_frames=7)
+    empty = archive.index["count"][numpy.searchsorted(archive.index["user_id"], user_ids)] == 0
+    assert empty.any()
+    numpy.testing.assert_array_equal(values[empty], 0.0)
+    assert len(archive.session(int(user_ids[empty][0]))) == 0
+
+
+def test_archive_of_empty_sessions_only(tmp_path):
+    archive = narr.Telemetry_Archive.write(str(tmp_path / "empty.tlm"),
+                                           [(user_id, numpy.zeros(0, dtype=narr.Telemetry_Archive.FRAME))
+                                            for user_id in range(3)])
+    user_ids, values = archive.aggregates(block_frames=2)
+    assert sorted(user_ids.tolist()) == [0, 1, 2]
+    numpy.testing.assert_array_equal(values, numpy.zeros((3, 3)))